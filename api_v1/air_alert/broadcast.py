@@ -0,0 +1,33 @@
+import asyncio
+
+
+class AlertBroadcaster:
+    """
+    Fan-out of rendered alert change events to stream subscribers.
+
+    Every subscriber reads from its own bounded queue. A client that cannot
+    keep up neither holds memory nor slows the others down: its backlog is
+    dropped and replaced with a None marker, after which it resyncs from the
+    full alert list.
+    """
+
+    def __init__(self, queue_size: int = 16):
+        self.queue_size = queue_size
+        self.subscribers: set[asyncio.Queue] = set()
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+
+    def publish(self, event):
+        for queue in self.subscribers:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
@@ -0,0 +1,124 @@
+import hashlib
+import uuid
+from collections import deque
+from typing import Optional
+
+# Alert fields that make up its content: a change in any of them is an update
+ALERT_FIELDS = (
+    "location_title",
+    "location_type",
+    "alert_type",
+    "location_oblast",
+    "location_raion",
+    "started_at",
+    "finished_at",
+    "notes",
+)
+
+
+def alert_key(alert):
+    """Identity of an alert across snapshots."""
+    key = getattr(alert, "id", None)
+    if key is not None:
+        return key
+    return (
+        getattr(alert, "location_title", None),
+        getattr(alert, "alert_type", None),
+        str(getattr(alert, "started_at", None)),
+    )
+
+
+def _fingerprint(alert) -> tuple:
+    return tuple(str(getattr(alert, field, None)) for field in ALERT_FIELDS)
+
+
+class AlertChangeFeed:
+    """
+    Versioned log of the differences between consecutive alert snapshots.
+
+    The version grows only when the set of active alerts actually changes. It
+    is prefixed with an id unique to this process, so a version issued by
+    another worker is treated as unknown rather than diffed against.
+    """
+
+    def __init__(self, keep: int = 100):
+        self.feed_id = uuid.uuid4().hex[:8]
+        self.number = 0
+        # Hash of the current alert set, usable as an ETag
+        self.content_hash: Optional[str] = None
+        self.alerts: dict = {}
+        # (number, started, ended, updated), each a {key: alert} dict
+        self._changes: deque = deque(maxlen=keep)
+
+    @property
+    def version(self) -> str:
+        return f"{self.feed_id}.{self.number}"
+
+    def record(self, alerts) -> bool:
+        """Diff a new snapshot against the current one; return True if it changed."""
+        new_alerts = {alert_key(alert): alert for alert in alerts}
+        fingerprints = sorted(
+            (str(key), _fingerprint(alert)) for key, alert in new_alerts.items()
+        )
+        content_hash = hashlib.sha1(repr(fingerprints).encode("utf-8")).hexdigest()
+        if content_hash == self.content_hash:
+            return False
+
+        old_alerts = self.alerts
+        started = {k: a for k, a in new_alerts.items() if k not in old_alerts}
+        ended = {k: a for k, a in old_alerts.items() if k not in new_alerts}
+        updated = {
+            k: a
+            for k, a in new_alerts.items()
+            if k in old_alerts and _fingerprint(a) != _fingerprint(old_alerts[k])
+        }
+
+        self.number += 1
+        self.content_hash = content_hash
+        self.alerts = new_alerts
+        self._changes.append((self.number, started, ended, updated))
+        return True
+
+    def changes_since(self, version: str) -> Optional[dict]:
+        """
+        Net changes after the given version as {"started", "ended", "updated"}
+        lists of alerts, or None when they are unknown and the client has to
+        reload the full list.
+        """
+        feed_id, _, number = version.partition(".")
+        if feed_id != self.feed_id or not number.isdigit():
+            return None
+        number = int(number)
+        if number > self.number:
+            return None
+        if number < self.number and number + 1 < self._changes[0][0]:
+            return None  # already dropped from the log
+
+        started, ended, updated = {}, {}, {}
+        for change_number, new, gone, changed in self._changes:
+            if change_number <= number:
+                continue
+            for key, alert in new.items():
+                if key in ended:
+                    # ended and started again: the client still has it
+                    del ended[key]
+                    updated[key] = alert
+                else:
+                    started[key] = alert
+            for key, alert in changed.items():
+                if key in started:
+                    started[key] = alert
+                else:
+                    updated[key] = alert
+            for key, alert in gone.items():
+                if key in started:
+                    # started and ended in between: the client never saw it
+                    del started[key]
+                else:
+                    updated.pop(key, None)
+                    ended[key] = alert
+        return {
+            "started": list(started.values()),
+            "ended": list(ended.values()),
+            "updated": list(updated.values()),
+        }
@@ -0,0 +1,141 @@
+import asyncio
+from typing import Optional
+
+import aiohttp
+from alerts_in_ua import AsyncClient as AsyncAlertsClient
+from alerts_in_ua.errors import (
+    ApiError,
+    ForbiddenError,
+    InternalServerError,
+    RateLimitError,
+    UnauthorizedError,
+)
+
+
+class PooledAlertsClient(AsyncAlertsClient):
+    """
+    alerts.in.ua client that reuses one keep-alive HTTP session for all requests.
+
+    The library client opens a new session, and so a new TCP+TLS connection,
+    for every request. This one keeps the session open until close(), applies a
+    timeout to every request and retries connection errors, timeouts and
+    upstream 500s a bounded number of times.
+
+    The library has no way to pass a session in, so its private _request() is
+    overridden; alerts-in-ua is pinned to the exact version this was written
+    against, and test_pooled_alerts_client_overrides_library_request checks it.
+    """
+
+    def __init__(
+        self,
+        token: str,
+        timeout: float = 5,
+        retries: int = 2,
+        pool_size: int = 4,
+        base_url: str = AsyncAlertsClient.API_BASE_URL,
+    ):
+        super().__init__(token=token)
+        self.api_base_url = base_url
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.retries = retries
+        self.pool_size = pool_size
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    async def open(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                self.api_base_url,
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                headers=self.headers,
+                timeout=self.timeout,
+            )
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _request(self, endpoint: str, use_cache=True):
+        for attempt in range(self.retries + 1):
+            try:
+                return await self._request_once(endpoint, use_cache)
+            except (
+                aiohttp.ClientConnectionError,
+                asyncio.TimeoutError,
+                InternalServerError,
+            ):
+                if attempt == self.retries:
+                    raise
+                await asyncio.sleep(0.5 * 2**attempt)
+
+    async def _request_once(self, endpoint: str, use_cache: bool):
+        await self.open()
+        cached_data = self.cache.get(endpoint) if use_cache else None
+        headers = {}
+        if cached_data:
+            headers["If-Modified-Since"] = cached_data["Last-Modified"]
+
+        async with self._session.get(
+            self.base_url + endpoint, headers=headers
+        ) as response:
+            if response.status == 304 and cached_data:
+                return cached_data["Data"]
+
+            if response.status == 200:
+                data = await response.json()
+                last_modified = response.headers.get("Last-Modified")
+                if last_modified:
+                    self.cache[endpoint] = {
+                        "Data": data,
+                        "Last-Modified": last_modified,
+                    }
+                return data
+
+            # Same errors as the library client raises
+            message = None
+            try:
+                data = await response.json()
+                message = f"{data.get('message')} HTTP Code:{response.status}"
+            except Exception:
+                pass
+            if response.status == 401:
+                raise UnauthorizedError(message or "Unauthorized: Incorrect token")
+            if response.status == 403:
+                raise ForbiddenError(
+                    message
+                    or "Forbidden. API may not be available in some regions. Please ask api@alerts.in.ua for details."
+                )
+            if response.status == 429:
+                raise RateLimitError(
+                    message or "Too many requests: Rate limit exceeded"
+                )
+            if response.status == 500:
+                raise InternalServerError("Internal server error")
+            raise ApiError(f"Unknown error. HTTP Code:{response.status}")
+
+
+# Long-lived client shared by all alert polls, opened and closed by the app lifespan
+alerts_client: Optional[PooledAlertsClient] = None
+
+
+async def open_alerts_client():
+    global alerts_client
+    from core.config import (
+        air_alert_api_token,
+        alerts_api_timeout,
+        alerts_api_retries,
+    )
+
+    alerts_client = PooledAlertsClient(
+        token=air_alert_api_token,
+        timeout=alerts_api_timeout,
+        retries=alerts_api_retries,
+    )
+    await alerts_client.open()
+
+
+async def close_alerts_client():
+    global alerts_client
+    if alerts_client is not None:
+        await alerts_client.close()
+        alerts_client = None
@@ -1,38 +1,322 @@
 import asyncio
+import hashlib
+import json
+import random
 import time
+from typing import Optional
 
-from api_v1.air_alert.dependencies import call_for_air_alert
+from fastapi.encoders import jsonable_encoder
+
+from api_v1.air_alert.broadcast import AlertBroadcaster
+from api_v1.air_alert.changes import AlertChangeFeed, alert_key
+from api_v1.air_alert.dependencies import (
+    call_for_air_alert,
+    _resolve_code_for_alert_obj,
+)
+from api_v1.air_alert.index import LOCATION_TYPE_FIELDS, AlertIndex
 from api_v1.air_alert.schemas import TerritorialOrganization
+from core.config import (
+    alerts_poll_interval,
+    alerts_poll_jitter,
+    alerts_poll_max_backoff,
+    alerts_stream_heartbeat,
+    alerts_stream_queue_size,
+)
+from core.tools.location.registry import get_city_registry
 
 active_alerts_cache = {}
 last_update_time = 0
 update_lock = asyncio.Lock()
+# Set while poll_active_alerts() keeps the cache fresh in the background
+poller_running = False
+
+# Body of /cached-alerts, rendered once per alerts refresh
+cached_alerts_render = {}
+
+# Alerts enriched with UA codes, rendered once per alerts refresh/codifier version
+enriched_alerts_cache = {}
+enrich_lock = asyncio.Lock()
+
+# Differences between consecutive alert snapshots, served by /air-alert/changes
+alert_feed = AlertChangeFeed()
+# Subscribers of /air-alert/stream, sent every change of the feed
+alert_broadcaster = AlertBroadcaster(alerts_stream_queue_size)
+
+
+async def refresh_active_alerts() -> dict:
+    """
+    Fetch the active alerts from upstream and replace the cached snapshot.
+    Callers must hold update_lock.
+    """
+    global active_alerts_cache, last_update_time
+    new_data = await call_for_air_alert()
+
+    active_alerts_cache = new_data
+    last_update_time = time.time()
+    previous_version = alert_feed.version
+    if alert_feed.record(new_data["data"].alerts) and alert_broadcaster.subscribers:
+        try:
+            await publish_alert_changes(previous_version)
+        except Exception as e:
+            # Lagging subscribers resync on their own, see stream_alert_changes()
+            print("ALERT PUBLISH FAILED: ", e)
+
+    try:
+        await refresh_enriched_alerts(new_data)
+    except Exception as e:
+        # Readers rebuild it on demand in get_enriched_alerts()
+        print("ALERT ENRICHMENT FAILED: ", e)
+
+    return active_alerts_cache
 
 
 async def get_active_alerts():
     """
     Зберігати та оновлючати поточний список активних тривог, кожні 20 секунд
+    (ALERTS_POLL_INTERVAL). While the background poller runs, the last good
+    snapshot is returned immediately, however old it is.
     :return:
     """
-    global active_alerts_cache, last_update_time, update_lock
     current_time = time.time()
 
-    if last_update_time > 0 and (current_time - last_update_time) < 20:
+    if _cache_is_usable(current_time):
         return active_alerts_cache
 
     async with update_lock:
-        if last_update_time > 0 and (current_time - last_update_time) < 20:
+        if _cache_is_usable(current_time):
             return active_alerts_cache
 
-        try:
-            new_data = await call_for_air_alert()
-        except Exception as e:
-            raise e
+        return await refresh_active_alerts()
 
-        active_alerts_cache = new_data
-        last_update_time = current_time
 
-    return active_alerts_cache
+def _cache_is_usable(current_time: float) -> bool:
+    if last_update_time <= 0:
+        return False
+    return poller_running or (current_time - last_update_time) < alerts_poll_interval
+
+
+def get_alerts_age() -> int:
+    """Seconds since the cached alerts were fetched from upstream."""
+    if last_update_time <= 0:
+        return 0
+    return int(time.time() - last_update_time)
+
+
+def render_cached_alerts() -> dict:
+    """
+    The /cached-alerts body of the current snapshot as {"body", "etag"},
+    rendered once per refresh. The ETag hashes the body itself, timestamp
+    included, so a 304 always stands for the same bytes.
+    """
+    global cached_alerts_render
+    if cached_alerts_render.get("snapshot") is not active_alerts_cache:
+        body = _render_json(active_alerts_cache)
+        cached_alerts_render = {
+            "snapshot": active_alerts_cache,
+            "body": body,
+            "etag": '"' + hashlib.sha1(body).hexdigest() + '"',
+        }
+    return cached_alerts_render
+
+
+def get_alerts_etag() -> str:
+    """ETag of the /cached-alerts body of the current snapshot."""
+    return render_cached_alerts()["etag"]
+
+
+def get_changes_etag() -> str:
+    """Weak ETag of /air-alert/changes: the UA codes also depend on the codifier."""
+    return f'W/"{alert_feed.version}-{get_city_registry().version[:12]}"'
+
+
+async def poll_active_alerts():
+    """
+    Keep the alerts snapshot fresh in the background, so requests never wait on
+    upstream. Polls every ALERTS_POLL_INTERVAL seconds with random jitter and
+    backs off exponentially (up to ALERTS_POLL_MAX_BACKOFF) while upstream fails.
+    """
+    global poller_running
+    poller_running = True
+    failures = 0
+    try:
+        while True:
+            try:
+                async with update_lock:
+                    await refresh_active_alerts()
+                failures = 0
+                delay = alerts_poll_interval
+            except Exception as e:
+                failures += 1
+                delay = min(alerts_poll_interval * 2**failures, alerts_poll_max_backoff)
+                print("ALERT POLL FAILED: ", e)
+            jitter = random.uniform(-alerts_poll_jitter, alerts_poll_jitter)
+            await asyncio.sleep(delay * (1 + jitter))
+    finally:
+        poller_running = False
+
+
+async def refresh_enriched_alerts(alerts_data: dict) -> dict:
+    """
+    Enrich the alerts with codifier codes and render the response body once, so
+    all readers share the same bytes until the next refresh.
+    """
+    global enriched_alerts_cache
+    cr = get_city_registry()
+    enriched = [await _enrich_alert(alert) for alert in alerts_data["data"].alerts]
+
+    payload = {"credit_for_location_data": cr.get_credit(), "data": enriched}
+    body = _render_json(payload)
+    enriched_alerts_cache = {
+        "timestamp": alerts_data["timestamp"],
+        "codifier_version": cr.version,
+        "data": enriched,
+        "body": body,
+        "etag": '"' + hashlib.sha1(body).hexdigest() + '"',
+        "index": AlertIndex(enriched),
+    }
+    return enriched_alerts_cache
+
+
+def _render_json(payload) -> bytes:
+    # Same encoding as FastAPI's JSONResponse
+    return json.dumps(
+        jsonable_encoder(payload),
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+async def _enrich_alert(alert) -> dict:
+    ua_code = await _resolve_code_for_alert_obj(alert)
+    return {
+        "location_title": getattr(alert, "location_title", None),
+        "alert_type": getattr(alert, "alert_type", None),
+        "location_oblast": getattr(alert, "location_oblast", None),
+        "location_raion": getattr(alert, "location_raion", None),
+        "started_at": getattr(alert, "started_at", None),
+        "location_type": getattr(alert, "location_type", None),
+        "ua_code": ua_code,
+    }
+
+
+def _enriched_is_current(alerts_data: dict) -> bool:
+    return (
+        enriched_alerts_cache.get("timestamp") == alerts_data["timestamp"]
+        and enriched_alerts_cache.get("codifier_version") == get_city_registry().version
+    )
+
+
+async def get_enriched_alerts() -> dict:
+    """
+    Return the enriched snapshot of the current alerts. It is rebuilt only when
+    the alerts were refreshed or the codifier changed since it was rendered.
+    """
+    alerts_data = await get_active_alerts()
+    if not _enriched_is_current(alerts_data):
+        async with enrich_lock:
+            if not _enriched_is_current(alerts_data):
+                await refresh_enriched_alerts(alerts_data)
+    return enriched_alerts_cache
+
+
+async def get_alert_changes(since: Optional[str] = None) -> dict:
+    """
+    Return how the active alerts changed after the `since` version, enriched
+    like /codifier/. When `since` is missing or unknown (issued by another
+    worker or already dropped from the log) the full list is returned with
+    reset=True instead.
+    """
+    await get_active_alerts()
+    return await _alert_changes(since)
+
+
+async def _alert_changes(since: Optional[str]) -> dict:
+    version = alert_feed.version
+    changes = alert_feed.changes_since(since) if since else None
+    result = {
+        "version": version,
+        "credit_for_location_data": get_city_registry().get_credit(),
+    }
+    if changes is None:
+        result["reset"] = True
+        result["data"] = await _enrich_alerts_with_ids(alert_feed.alerts.values())
+        return result
+
+    result["reset"] = False
+    for kind, alerts in changes.items():
+        result[kind] = await _enrich_alerts_with_ids(alerts)
+    return result
+
+
+async def _enrich_alerts_with_ids(alerts) -> list[dict]:
+    enriched = []
+    for alert in alerts:
+        key = alert_key(alert)
+        item = await _enrich_alert(alert)
+        # Fallback keys are tuples; clients only need the id when upstream has one
+        item["id"] = key if not isinstance(key, tuple) else None
+        enriched.append(item)
+    return enriched
+
+
+def _render_event(changes: dict) -> bytes:
+    # One line of JSON, so the event needs a single data field
+    return (
+        b"id: "
+        + changes["version"].encode()
+        + b"\nevent: alerts\ndata: "
+        + _render_json(changes)
+        + b"\n\n"
+    )
+
+
+def _version_number(version: str) -> int:
+    return int(version.rsplit(".", 1)[1])
+
+
+async def publish_alert_changes(since: str):
+    """Render the changes after `since` once and queue them for every subscriber."""
+    changes = await _alert_changes(since)
+    alert_broadcaster.publish(
+        (_version_number(changes["version"]), _render_event(changes))
+    )
+
+
+async def stream_alert_changes(since: Optional[str] = None):
+    """
+    Yield server-sent events for /air-alert/stream: first the changes after
+    `since` (the full list without it), then every change as the alerts are
+    refreshed. A subscriber whose queue overflowed gets the full list again.
+    """
+    queue = alert_broadcaster.subscribe()
+    try:
+        changes = await get_alert_changes(since)
+        sent = _version_number(changes["version"])
+        yield _render_event(changes)
+        while True:
+            try:
+                item = await asyncio.wait_for(queue.get(), alerts_stream_heartbeat)
+            except asyncio.TimeoutError:
+                try:
+                    # Refreshes the alerts when no background poller does
+                    await get_active_alerts()
+                except Exception as e:
+                    print("ALERT STREAM REFRESH FAILED: ", e)
+                yield b": keep-alive\n\n"
+                continue
+            if item is None:
+                changes = await get_alert_changes()
+                sent = _version_number(changes["version"])
+                yield _render_event(changes)
+                continue
+            number, event = item
+            # Already covered by the initial or resync event
+            if number > sent:
+                sent = number
+                yield event
+    finally:
+        alert_broadcaster.unsubscribe(queue)
 
 
 async def filter_by_location_type(location_type: TerritorialOrganization):
@@ -41,18 +325,65 @@ async def filter_by_location_type(location_type: TerritorialOrganization):
     :param location_type: TerritorialOrganization
     """
     alerts_data = await get_active_alerts()
-    all_alerts = alerts_data["data"].alerts
-
-    filtered_data = [
-        {
-            "location_title": alert.location_title,
-            "alert_type": alert.alert_type,
-            "location_oblast": alert.location_oblast,
-            "location_raion": alert.location_raion,
-            "started_at": alert.started_at,
-        }
-        for alert in all_alerts
-        if alert.location_type == location_type.value
-    ]
+    try:
+        snapshot = await get_enriched_alerts()
+    except Exception as e:
+        # The groups need no codifier codes: group the raw alerts instead
+        print("ALERT ENRICHMENT FAILED: ", e)
+        return [
+            {field: getattr(alert, field) for field in LOCATION_TYPE_FIELDS}
+            for alert in alerts_data["data"].alerts
+            if alert.location_type == location_type.value
+        ]
+    return snapshot["index"].location_type_groups.get(location_type.value, [])
+
 
-    return filtered_data
+async def get_alert_status(ua_codes: list[str]) -> dict:
+    """
+    Whether each UA code is under alert: an alert on the unit itself or on
+    any unit containing it (hromada, raion, oblast) covers it.
+    """
+    snapshot = await get_enriched_alerts()
+    index = snapshot["index"]
+    chains = await get_city_registry().ancestor_codes_many(ua_codes)
+    data = []
+    for ua_code, chain in zip(ua_codes, chains):
+        # Unknown codes can still match an alert resolved to exactly that code,
+        # in the "UA..." form ancestor codes are given in
+        code = ua_code.strip().upper()
+        alerts = index.covering(chain or ["UA" + code.removeprefix("UA")])
+        data.append(
+            {
+                "ua_code": ua_code,
+                "found": chain is not None,
+                "under_alert": bool(alerts),
+                "alerts": alerts,
+            }
+        )
+    return {
+        "credit_for_location_data": get_city_registry().get_credit(),
+        "data": data,
+    }
+
+
+async def query_alerts(
+    location_type: Optional[TerritorialOrganization] = None,
+    oblast: Optional[str] = None,
+    raion: Optional[str] = None,
+    code_prefix: Optional[str] = None,
+) -> dict:
+    """
+    Enriched alerts matching all the given filters, e.g. code_prefix="UA51"
+    for every alert in Odesa oblast.
+    """
+    snapshot = await get_enriched_alerts()
+    data = snapshot["index"].query(
+        location_type=location_type.value if location_type else None,
+        oblast=oblast,
+        raion=raion,
+        code_prefix=code_prefix,
+    )
+    return {
+        "credit_for_location_data": get_city_registry().get_credit(),
+        "data": data,
+    }
@@ -1,23 +1,16 @@
 from alerts_in_ua import AsyncClient as AsyncAlertsClient
-from pathlib import Path
 from api_v1.air_alert.schemas import TerritorialOrganization
+from core.tools.location.registry import get_city_registry
 from core.tools.location.tool import CityRegistry
+from collections import OrderedDict
 from typing import Optional
 import re
 import datetime
 
-_DATA_PATH = (
-    Path(__file__).parents[2] / "core" / "tools" / "location" / "kodifikator.json"
-)
-
-_cr_instance = None
-
-
-def get_city_registry():
-    global _cr_instance
-    if _cr_instance is None:
-        _cr_instance = CityRegistry(str(_DATA_PATH))
-    return _cr_instance
+# Resolved UA codes by alert location key, most recently used last
+RESOLVE_CACHE_SIZE = 4096
+_resolve_cache: OrderedDict = OrderedDict()
+_resolve_cache_version: Optional[str] = None
 
 
 def _norm_str(x: Optional[str]) -> Optional[str]:
@@ -64,28 +57,66 @@ def _clean_raion_name(name: str) -> str:
     return re.sub(r"\s+", " ", s).strip()
 
 
+def _alert_location_key(alert) -> tuple:
+    """
+    Normalized location fields of an alert. The resolved code depends only on them.
+    """
+    return (
+        getattr(alert, "location_type", None),
+        _norm_str(getattr(alert, "location_oblast", None)),
+        _norm_str(getattr(alert, "location_raion", None)),
+        # Optional fields that can help
+        _norm_str(getattr(alert, "location_hromada", None)),
+        _norm_str(getattr(alert, "location_city", None)),
+        _norm_str(getattr(alert, "location_settlement", None)),
+        _norm_str(getattr(alert, "location_title", None)) or "",
+    )
+
+
 async def _resolve_code_for_alert_obj(alert) -> Optional[str]:
     """
     Resolve UA code for an active alert object.
-    Try hierarchical resolution first; if it fails, perform a name search.
+    Results are memoized per location key (LRU) for the loaded codifier version.
     """
+    global _resolve_cache_version
     cr = get_city_registry()
-    loc_type = getattr(alert, "location_type", None)
-    region_name = _norm_str(getattr(alert, "location_oblast", None))
-    district_name = _norm_str(getattr(alert, "location_raion", None))
-    title = _norm_str(getattr(alert, "location_title", None)) or ""
-
+    if cr.version != _resolve_cache_version:
+        _resolve_cache.clear()
+        _resolve_cache_version = cr.version
+
+    key = _alert_location_key(alert)
+    if key in _resolve_cache:
+        _resolve_cache.move_to_end(key)
+        return _resolve_cache[key]
+
+    code = await _resolve_code(cr, *key)
+    # The codifier may have been swapped while resolving
+    if _resolve_cache_version == cr.version:
+        _resolve_cache[key] = code
+        if len(_resolve_cache) > RESOLVE_CACHE_SIZE:
+            _resolve_cache.popitem(last=False)
+    return code
+
+
+async def _resolve_code(
+    cr: CityRegistry,
+    loc_type: Optional[str],
+    region_name: Optional[str],
+    district_name: Optional[str],
+    location_hromada: Optional[str],
+    location_city: Optional[str],
+    location_settlement: Optional[str],
+    title: str,
+) -> Optional[str]:
+    """
+    Try hierarchical resolution first; if it fails, perform a name search.
+    """
     # Normalize oblast and raion names to match codifier entries
     if region_name:
         region_name = _clean_region_name(region_name)
     if district_name:
         district_name = _clean_raion_name(district_name)
 
-    # Optional fields that can help
-    location_hromada = _norm_str(getattr(alert, "location_hromada", None))
-    location_city = _norm_str(getattr(alert, "location_city", None))
-    location_settlement = _norm_str(getattr(alert, "location_settlement", None))
-
     # Prepare cleaned names based on a location type
     community_name: Optional[str] = None
     unit_name: Optional[str] = None
@@ -157,7 +188,8 @@ async def _resolve_code_for_alert_obj(alert) -> Optional[str]:
 
     if query:
         try:
-            matches = await cr.search(query)
+            # Name search only returns settlements with a valid code
+            matches, _ = await cr.search_page(query, limit=1)
             for chain, code, cat in matches:
                 if code and code != "nan":
                     return code
@@ -169,8 +201,12 @@ async def _resolve_code_for_alert_obj(alert) -> Optional[str]:
 
 async def call_for_air_alert():
     from core.config import air_alert_api_token
+    from api_v1.air_alert import client
 
-    alerts_client = AsyncAlertsClient(token=air_alert_api_token)
+    # Pooled client from the app lifespan; a one-off client outside of it
+    alerts_client = client.alerts_client or AsyncAlertsClient(
+        token=air_alert_api_token
+    )
     active_alerts = await alerts_client.get_active_alerts()
     print("ALERT API REQUEST: ", datetime.datetime.now())
     return {"data": active_alerts, "timestamp": datetime.datetime.now()}
@@ -0,0 +1,115 @@
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Optional
+
+from api_v1.air_alert.dependencies import _clean_raion_name, _clean_region_name
+
+# Fields returned by /air-alert/filter-by-location-type
+LOCATION_TYPE_FIELDS = (
+    "location_title",
+    "alert_type",
+    "location_oblast",
+    "location_raion",
+    "started_at",
+)
+
+
+def _region_key(name) -> Optional[str]:
+    return _clean_region_name(name).casefold() if isinstance(name, str) else None
+
+
+def _raion_key(name) -> Optional[str]:
+    return _clean_raion_name(name).casefold() if isinstance(name, str) else None
+
+
+class AlertIndex:
+    """
+    Enriched alerts of one snapshot grouped by location type, oblast, raion and
+    UA code, so filtered queries cost O(result) instead of a scan.
+    """
+
+    def __init__(self, items: list[dict]):
+        self.items = items
+        # (location type, oblast key, raion key, UA code) of every alert
+        self._keys = [
+            (
+                item["location_type"],
+                _region_key(item["location_oblast"]),
+                _raion_key(item["location_raion"]),
+                item["ua_code"] or "",
+            )
+            for item in items
+        ]
+        self._groups = [defaultdict(list), defaultdict(list), defaultdict(list)]
+        for pos, keys in enumerate(self._keys):
+            for group, key in zip(self._groups, keys):
+                group[key].append(pos)
+        # Sorted codes: all codes under a prefix are one contiguous range
+        coded = sorted((keys[3], pos) for pos, keys in enumerate(self._keys) if keys[3])
+        self._codes = [code for code, _ in coded]
+        self._code_pos = [pos for _, pos in coded]
+        # UA code -> positions of the alerts on exactly that unit
+        self._on_code = defaultdict(list)
+        for code, pos in coded:
+            self._on_code[code].append(pos)
+
+        self.location_type_groups = {
+            location_type: [
+                {field: items[pos][field] for field in LOCATION_TYPE_FIELDS}
+                for pos in positions
+            ]
+            for location_type, positions in self._groups[0].items()
+        }
+
+    def _under_code(self, prefix: str) -> list[int]:
+        start = bisect_left(self._codes, prefix)
+        end = bisect_left(self._codes, prefix + "\uffff", start)
+        return sorted(self._code_pos[start:end])
+
+    def covering(self, codes: list[str]) -> list[dict]:
+        """Alerts on any of the given units, e.g. a code and its ancestors."""
+        positions = sorted(
+            pos
+            for code in codes
+            if code in self._on_code
+            for pos in self._on_code[code]
+        )
+        return [self.items[pos] for pos in positions]
+
+    def query(
+        self,
+        location_type: Optional[str] = None,
+        oblast: Optional[str] = None,
+        raion: Optional[str] = None,
+        code_prefix: Optional[str] = None,
+    ) -> list[dict]:
+        """Alerts matching all the given criteria, in snapshot order."""
+        # (matching positions, key number, key value) per criterion
+        checks = []
+        for field, key in enumerate(
+            (location_type, _region_key(oblast), _raion_key(raion))
+        ):
+            if key is not None:
+                checks.append((self._groups[field].get(key, []), field, key))
+        if code_prefix is not None:
+            prefix = code_prefix.strip().upper()
+            checks.append((self._under_code(prefix), 3, prefix))
+        if not checks:
+            return list(self.items)
+
+        # Walk the smallest group, check the rest per alert
+        checks.sort(key=lambda check: len(check[0]))
+        positions = checks[0][0]
+        rest = checks[1:]
+        return [
+            self.items[pos]
+            for pos in positions
+            if all(
+                (
+                    self._keys[pos][field].startswith(key)
+                    if field == 3
+                    else self._keys[pos][field] == key
+                )
+                for _, field, key in rest
+            )
+        ]
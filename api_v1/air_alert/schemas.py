@@ -1,4 +1,9 @@
 from enum import Enum
+from typing import List
+
+from pydantic import BaseModel, Field
+
+from api_v1.location.schemas import UACode
 
 
 class TerritorialOrganization(str, Enum):
@@ -10,3 +15,9 @@ class TerritorialOrganization(str, Enum):
     RAION = "raion"
     HROMADA = "hromada"
     CITY = "city"
+
+
+class AlertStatusRequest(BaseModel):
+    codes: List[UACode] = Field(
+        ..., min_length=1, max_length=1000, description="UA codes to check"
+    )
@@ -1,49 +1,161 @@
-from fastapi import APIRouter
+from typing import Optional
 
-from api_v1.air_alert.crud import get_active_alerts, filter_by_location_type
-from api_v1.air_alert.dependencies import _resolve_code_for_alert_obj
-from api_v1.air_alert.schemas import TerritorialOrganization
-from api_v1.location.dependecies import credentials_return
+from fastapi import APIRouter, Request, Response
+from fastapi.responses import StreamingResponse
+
+from api_v1.air_alert.crud import (
+    get_active_alerts,
+    get_alerts_age,
+    render_cached_alerts,
+    get_alert_changes,
+    get_changes_etag,
+    stream_alert_changes,
+    get_enriched_alerts,
+    filter_by_location_type,
+    get_alert_status,
+    query_alerts,
+)
+from api_v1.air_alert.schemas import AlertStatusRequest, TerritorialOrganization
+from api_v1.location.schemas import UACode
 
 router = APIRouter(prefix="/air-alert", tags=["Air Alert"])
 
 
+def _etag_matches(request: Request, etag: str) -> bool:
+    """Weak If-None-Match comparison, as HTTP requires for GET."""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag.removeprefix("W/") in tags
+
+
+def _not_modified(etag: str) -> Response:
+    return Response(
+        status_code=304, headers={"ETag": etag, "Age": str(get_alerts_age())}
+    )
+
+
 @router.get("/cached-alerts")
-async def return_cached_alerts():
-    return await get_active_alerts()
+async def return_cached_alerts(request: Request):
+    await get_active_alerts()
+    rendered = render_cached_alerts()
+    if _etag_matches(request, rendered["etag"]):
+        return _not_modified(rendered["etag"])
+    return Response(
+        content=rendered["body"],
+        media_type="application/json",
+        # Seconds since the snapshot was fetched from upstream
+        headers={"Age": str(get_alerts_age()), "ETag": rendered["etag"]},
+    )
 
 
 @router.get("/filter-by-location-type/{location_type}")
-async def get_alerts_filterer(location_type: TerritorialOrganization):
+async def get_alerts_filterer(
+    location_type: TerritorialOrganization, response: Response
+):
     """
     Групування повітряних тривог за територіальною організацією.
     """
-    return await filter_by_location_type(location_type=location_type)
+    filtered = await filter_by_location_type(location_type=location_type)
+    response.headers["Age"] = str(get_alerts_age())
+    return filtered
+
+
+@router.get("/query")
+async def get_alerts_query(
+    response: Response,
+    location_type: Optional[TerritorialOrganization] = None,
+    oblast: Optional[str] = None,
+    raion: Optional[str] = None,
+    code_prefix: Optional[str] = None,
+):
+    """
+    Активні тривоги за кількома фільтрами одночасно: тип локації, область, район
+    та префікс коду кодифікатора (наприклад UA51 - всі тривоги в Одеській області).
+    """
+    result = await query_alerts(
+        location_type=location_type,
+        oblast=oblast,
+        raion=raion,
+        code_prefix=code_prefix,
+    )
+    response.headers["Age"] = str(get_alerts_age())
+    return result
+
+
+@router.get("/status/{ua_code}")
+async def get_code_alert_status(ua_code: UACode, response: Response):
+    """
+    Чи є тривога на території з кодом кодифікатора: на самій одиниці або на
+    громаді, районі чи області, до яких вона входить.
+    """
+    result = await get_alert_status([ua_code])
+    response.headers["Age"] = str(get_alerts_age())
+    return {
+        "credit_for_location_data": result["credit_for_location_data"],
+        **result["data"][0],
+    }
+
+
+@router.post("/status")
+async def get_codes_alert_status(request: AlertStatusRequest, response: Response):
+    """
+    Статус тривоги для багатьох кодів кодифікатора за один запит (до 1000).
+    """
+    result = await get_alert_status(request.codes)
+    response.headers["Age"] = str(get_alerts_age())
+    return result
 
 
 @router.get("/codifier/")
-async def return_alerts_codifier():
+async def return_alerts_codifier(request: Request):
     """
     Return all active alerts enriched with codifier code of the territory.
     Attempts robust resolution so every active alert has a UA code if possible.
     """
-    credit_location_data = await credentials_return()
-    alerts_data = await get_active_alerts()
-    all_alerts = alerts_data["data"].alerts
-
-    enriched: list[dict] = []
-    for alert in all_alerts:
-        ua_code = await _resolve_code_for_alert_obj(alert)
-        enriched.append(
-            {
-                "location_title": getattr(alert, "location_title", None),
-                "alert_type": getattr(alert, "alert_type", None),
-                "location_oblast": getattr(alert, "location_oblast", None),
-                "location_raion": getattr(alert, "location_raion", None),
-                "started_at": getattr(alert, "started_at", None),
-                "location_type": getattr(alert, "location_type", None),
-                "ua_code": ua_code,
-            }
-        )
-
-    return {"credit_for_location_data": credit_location_data, "data": enriched}
+    snapshot = await get_enriched_alerts()
+    if _etag_matches(request, snapshot["etag"]):
+        return _not_modified(snapshot["etag"])
+    return Response(
+        content=snapshot["body"],
+        media_type="application/json",
+        headers={"Age": str(get_alerts_age()), "ETag": snapshot["etag"]},
+    )
+
+
+@router.get("/changes")
+async def return_alert_changes(
+    request: Request, response: Response, since: Optional[str] = None
+):
+    """
+    Зміни в активних тривогах після версії `since`: started, ended та updated.
+    Pass the returned `version` as `since` on the next call. Without `since`,
+    or when the version is no longer known, the full list is returned in
+    `data` with `reset: true`.
+    """
+    await get_active_alerts()
+    etag = get_changes_etag()
+    if _etag_matches(request, etag):
+        return _not_modified(etag)
+    changes = await get_alert_changes(since)
+    response.headers["Age"] = str(get_alerts_age())
+    response.headers["ETag"] = etag
+    return changes
+
+
+@router.get("/stream")
+async def stream_alerts(request: Request, since: Optional[str] = None):
+    """
+    Server-Sent Events з змінами активних тривог, у форматі /air-alert/changes.
+    The first event holds the changes after `since` (or the Last-Event-ID
+    header on reconnect), or the full list with `reset: true`.
+    """
+    since = request.headers.get("last-event-id") or since
+    return StreamingResponse(
+        stream_alert_changes(since),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,14 +1,15 @@
 import json
 import os
 
+from core.tools.location.registry import get_city_registry
+
 
 async def credentials_return(
     path=None,
 ):
     if path is None:
-        # Build the path relative to the project root
-        base_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
-        path = os.path.join(base_dir, "core", "tools", "location", "kodifikator.json")
+        # Served from the loaded codifier snapshot instead of re-reading the file
+        return get_city_registry().get_credit()
     if not os.path.exists(path):
         raise FileNotFoundError(f"File not found: {path}")
     with open(path, "r", encoding="utf-8") as f:
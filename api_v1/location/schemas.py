@@ -1,6 +1,9 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, constr
 from typing import List, Optional
 
+UA_CODE_PATTERN = r"^(UA)?\d{10,20}$"
+UACode = constr(pattern=UA_CODE_PATTERN)
+
 
 class Option(BaseModel):
     name: str
@@ -57,6 +60,9 @@ class Credit(BaseModel):
 class SearchResponse(BaseModel):
     credit: Credit
     data: List[Match] = Field(..., description="List of found matches")
+    next_cursor: Optional[str] = Field(
+        None, description="Pass as cursor to get the next page; null on the last page"
+    )
 
 
 class HierarchyResponse(BaseModel):
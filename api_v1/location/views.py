@@ -1,6 +1,9 @@
+import asyncio
+import json
+from itertools import islice
 from typing import Optional
 from fastapi import APIRouter, HTTPException, Query, Depends
-from pydantic import constr
+from fastapi.responses import StreamingResponse
 
 from .schemas import (
     Match,
@@ -9,24 +12,68 @@ from .schemas import (
     SearchResponse,
     HierarchyResponse,
     CodeSearchResponse,
+    UACode,
 )
 from core.tools.location.tool import CityRegistry
+from core.tools.location.registry import get_city_registry
 from api_v1.location.dependecies import credentials_return
 
-
 router = APIRouter(prefix="/codifier", tags=["codifier"])
 
-UA_CODE_PATTERN = r"^(UA)?\d{10,20}$"
-UACode = constr(pattern=UA_CODE_PATTERN)
+# Number of NDJSON lines sent per chunk when streaming search results
+STREAM_CHUNK_LINES = 100
+
 
+def _make_cursor(cr: CityRegistry, pos: int) -> str:
+    # Positions are only meaningful in the codifier version they come from
+    return f"{cr.version[:12]}:{pos}"
 
-def get_city_registry():
-    import os
 
-    # Get the absolute path to the JSON file
-    base_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
-    data_path = os.path.join(base_dir, "core", "tools", "location", "kodifikator.json")
-    return CityRegistry(data_path)
+def _parse_cursor(cr: CityRegistry, cursor: Optional[str]) -> int:
+    if cursor is None:
+        return -1
+    version, _, pos = cursor.rpartition(":")
+    if not version or not pos.isdigit():
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if version != cr.version[:12]:
+        raise HTTPException(
+            status_code=409, detail="Cursor is stale: the codifier has been updated"
+        )
+    return int(pos)
+
+
+async def _stream_matches(
+    cr: CityRegistry,
+    q: str,
+    prefix: bool,
+    limit: Optional[int],
+    after: int,
+):
+    """
+    Yield NDJSON: the credit block first, then one match per line. If the
+    limit cuts the results short, the last line holds next_cursor.
+    """
+    lines = ['{"credit": ' + cr.credit_json + "}"]
+    stop = None if limit is None else limit + 1
+    for n, (pos, (chain, code, cat)) in enumerate(
+        islice(cr.iter_search(q, prefix, after), stop)
+    ):
+        if n == limit:
+            lines.append(json.dumps({"next_cursor": _make_cursor(cr, last_pos)}))
+            break
+        last_pos = pos
+        lines.append(
+            json.dumps(
+                {"chain": chain, "code": code, "category": cat}, ensure_ascii=False
+            )
+        )
+        if len(lines) >= STREAM_CHUNK_LINES:
+            yield ("\n".join(lines) + "\n").encode()
+            lines = []
+            # let other requests run between chunks
+            await asyncio.sleep(0)
+    if lines:
+        yield ("\n".join(lines) + "\n").encode()
 
 
 @router.get(
@@ -37,18 +84,35 @@ def get_city_registry():
 )
 async def search(
     q: str = Query(..., description="Fragment of name to search"),
+    prefix: bool = Query(False, description="Match only names starting with q"),
+    limit: Optional[int] = Query(
+        None, ge=1, le=1000, description="Maximum number of matches to return"
+    ),
+    cursor: Optional[str] = Query(
+        None,
+        description="next_cursor of the previous page; 409 once the codifier is updated",
+    ),
+    stream: bool = Query(False, description="Stream matches as NDJSON lines"),
     cr: CityRegistry = Depends(get_city_registry),
 ):
     """
     Search settlements by name fragment.
     """
-    matches = await cr.search(q)
+    after = _parse_cursor(cr, cursor)
+    if stream:
+        return StreamingResponse(
+            _stream_matches(cr, q, prefix, limit, after),
+            media_type="application/x-ndjson",
+        )
+
     credit_data = await credentials_return()
+    matches, next_pos = await cr.search_page(q, limit, prefix=prefix, after=after)
     return {
         "credit": credit_data,
         "data": [
             Match(chain=chain, code=code, category=cat) for chain, code, cat in matches
         ],
+        "next_cursor": None if next_pos is None else _make_cursor(cr, next_pos),
     }
 
 
@@ -109,6 +173,18 @@ async def search_with_code(
         raise HTTPException(status_code=500, detail=f"Помилка пошуку: {str(e)}")
 
 
+def _hierarchy_response(
+    credit_data: dict, items: list[tuple[str, str, Optional[str]]]
+) -> HierarchyResponse:
+    return HierarchyResponse(
+        credit=credit_data,
+        data=[
+            HierarchyOption(name=name, category=category, code=code)
+            for name, category, code in items
+        ],
+    )
+
+
 @router.get("/location", response_model=HierarchyResponse)
 async def get_hierarchy(
     region: Optional[str] = Query(None, description="Region name"),
@@ -119,18 +195,8 @@ async def get_hierarchy(
     credit_data = await credentials_return()
     # 1) Getting region list
     if not region:
-        items = await cr.list_level_with_cat("region")
-        return HierarchyResponse(
-            credit=credit_data,
-            data=[
-                HierarchyOption(
-                    name=name,
-                    category=category,
-                    code=await cr.get_code(name),
-                )
-                for name, category in items
-            ],
-        )
+        items = await cr.list_children("region")
+        return _hierarchy_response(credit_data, items)
 
     reg = region.strip()
     reg_code = await cr.get_code(reg)
@@ -139,20 +205,8 @@ async def get_hierarchy(
 
     # 2) Getting districts in region
     if not district:
-        items = await cr.list_level_with_cat(
-            "district", parent_key="First_Level", parent_code=reg_code
-        )
-        return HierarchyResponse(
-            credit=credit_data,
-            data=[
-                HierarchyOption(
-                    name=name,
-                    category=category,
-                    code=await cr.get_code(reg, name),
-                )
-                for name, category in items
-            ],
-        )
+        items = await cr.list_children("district", parent_code=reg_code)
+        return _hierarchy_response(credit_data, items)
 
     dist = district.strip()
     dist_code = await cr.get_code(reg, dist)
@@ -161,20 +215,8 @@ async def get_hierarchy(
 
     # 3) Getting communities in a district
     if not community:
-        items = await cr.list_level_with_cat(
-            "community", parent_key="Second_Level", parent_code=dist_code
-        )
-        return HierarchyResponse(
-            credit=credit_data,
-            data=[
-                HierarchyOption(
-                    name=name,
-                    category=category,
-                    code=await cr.get_code(reg, dist, name),
-                )
-                for name, category in items
-            ],
-        )
+        items = await cr.list_children("community", parent_code=dist_code)
+        return _hierarchy_response(credit_data, items)
 
     # 4) Getting territories in communit (without changing the code)
     comm = community.strip()
@@ -182,17 +224,5 @@ async def get_hierarchy(
     if not comm_code:
         raise HTTPException(status_code=404, detail="Community not found")
 
-    items = await cr.list_level_with_cat(
-        "unit", parent_key="Third_Level", parent_code=comm_code
-    )
-    return HierarchyResponse(
-        credit=credit_data,
-        data=[
-            HierarchyOption(
-                name=name,
-                category=category,
-                code=await cr.get_code(reg, dist, comm, name),
-            )
-            for name, category in items
-        ],
-    )
+    items = await cr.list_children("unit", parent_code=comm_code)
+    return _hierarchy_response(credit_data, items)
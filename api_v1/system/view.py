@@ -1,13 +1,81 @@
-from fastapi import APIRouter, Depends
-from core.tools.location.xsls_to_json import download_xlsx_and_parse_to_json
+import asyncio
+
+from fastapi import APIRouter, Depends, HTTPException
+from core.tools.location.refresh import get_refresh_job, start_refresh
+from core.tools.location.registry import registry_holder
+from core.tools.location.xsls_to_json import read_diff_report
 
 router = APIRouter(prefix="/system", tags=["System"])
 
 
-@router.post("/request_update_kodifier")
+@router.post("/request_update_kodifier", status_code=202)
 async def request_update_kodifier():
     """
-    Надіслати та обробити запит про оновлення даних кодифікатора.
+    Запустити оновлення кодифікатора у фоновому процесі. Поки оновлення триває,
+    повторні запити отримують ту саму задачу. Стан задачі - за її job_id.
+    """
+    return start_refresh().as_dict()
+
+
+@router.get("/request_update_kodifier/{job_id}")
+async def get_update_kodifier_job(job_id: str):
+    """
+    Стан задачі оновлення кодифікатора.
+    """
+    job = get_refresh_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.as_dict()
+
+
+@router.get("/kodifier_diff")
+async def get_kodifier_diff():
+    """
+    Зміни, внесені останнім оновленням кодифікатора: додані, вилучені,
+    перейменовані, перепідпорядковані коди та коди зі зміненою категорією.
+    Порівнюється з попереднім завантаженим кодифікатором; якщо тоді була
+    закріплена інша версія, вона вказана у "pinned".
+    """
+    report = await asyncio.to_thread(read_diff_report, registry_holder.path)
+    if report is None:
+        raise HTTPException(status_code=404, detail="No codifier diff yet")
+    return report
+
+
+@router.get("/kodifier_versions")
+async def get_kodifier_versions():
+    """
+    Збережені версії кодифікатора (за номером наказу), від найновішої.
+    Закріплена версія обслуговується замість останньої завантаженої.
+    """
+    versions = registry_holder.versions
+    items = await asyncio.to_thread(versions.versions)
+    loaded = registry_holder.loaded_version()
+    return {
+        "pinned": await asyncio.to_thread(versions.pinned),
+        "versions": [dict(item, active=item["version"] == loaded) for item in items],
+    }
+
+
+@router.post("/kodifier_versions/{order_number}/pin")
+async def pin_kodifier_version(order_number: str):
+    """
+    Закріпити збережену версію кодифікатора (або відкотитися до неї) без
+    повторного розбору файлу. Оновлення її не замінюють до відкріплення.
+    """
+    try:
+        meta = await asyncio.to_thread(registry_holder.versions.pin, order_number)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Version not found")
+    await registry_holder.reload()
+    return meta
+
+
+@router.delete("/kodifier_versions/pin")
+async def unpin_kodifier_version():
+    """
+    Відкріпити версію: знову обслуговується останній завантажений кодифікатор.
     """
-    result = await download_xlsx_and_parse_to_json()
-    return result
+    await asyncio.to_thread(registry_holder.versions.unpin)
+    await registry_holder.reload()
+    return {"pinned": None, "version": registry_holder.loaded_version()}
@@ -1,8 +1,29 @@
 import os
 from dotenv import load_dotenv
 
-
 load_dotenv()
 
 air_alert_api_token = os.getenv("AIR_ALERT_API_TOKEN")
 correct_token = os.getenv("CORRECT_TOKEN")
+
+# Threads reserved for expensive codifier scans (cheap lookups run inline)
+registry_scan_workers = int(os.getenv("REGISTRY_SCAN_WORKERS", "2"))
+# "memory" reads a copy of the codifier store into every process, "mmap" maps
+# the one shared read-only store file instead
+registry_backend = os.getenv("REGISTRY_BACKEND", "memory")
+# Codifier versions kept on disk for pinning and rollback
+codifier_versions_keep = int(os.getenv("CODIFIER_VERSIONS_KEEP", "5"))
+
+# Background polling of the upstream alerts API (seconds)
+alerts_poll_interval = float(os.getenv("ALERTS_POLL_INTERVAL", "20"))
+alerts_poll_jitter = float(os.getenv("ALERTS_POLL_JITTER", "0.1"))
+alerts_poll_max_backoff = float(os.getenv("ALERTS_POLL_MAX_BACKOFF", "300"))
+
+# Upstream alerts API requests: timeout in seconds and retries on failures
+alerts_api_timeout = float(os.getenv("ALERTS_API_TIMEOUT", "5"))
+alerts_api_retries = int(os.getenv("ALERTS_API_RETRIES", "2"))
+
+# Alert change stream: events buffered per client before it is resynced, and
+# seconds between keep-alive comments
+alerts_stream_queue_size = int(os.getenv("ALERTS_STREAM_QUEUE_SIZE", "16"))
+alerts_stream_heartbeat = float(os.getenv("ALERTS_STREAM_HEARTBEAT", "15"))
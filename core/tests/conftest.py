@@ -0,0 +1,102 @@
+import json
+
+import pytest
+
+NAN = float("nan")
+
+CODIFIER = {
+    "provider": {
+        "name": "Міністерство розвитку громад, територій та інфраструктури України",
+        "service": "Кодифікатор адміністративно-територіальних одиниць",
+        "license": "Creative Commons Attribution 4.0 International (CC BY 4.0)",
+    },
+    "order": {
+        "title": "Наказ № 290 від 26 листопада 2020 року",
+        "number": "290",
+        "date": "26 листопада 2020",
+        "pdf_url": "https://mindev.gov.ua/order.pdf",
+    },
+    "data": [
+        {
+            "level1": "UA51000000000030770",
+            "level2": NAN,
+            "level3": NAN,
+            "level4": NAN,
+            "level_extra": NAN,
+            "category": "O",
+            "name": "Одеська",
+        },
+        {
+            "level1": "UA51000000000030770",
+            "level2": "UA51040000000042921",
+            "level3": NAN,
+            "level4": NAN,
+            "level_extra": NAN,
+            "category": "P",
+            "name": "Білгород-Дністровський",
+        },
+        {
+            "level1": "UA51000000000030770",
+            "level2": "UA51040000000042921",
+            "level3": "UA51040250000046164",
+            "level4": NAN,
+            "level_extra": NAN,
+            "category": "H",
+            "name": "Татарбунарська",
+        },
+        {
+            "level1": "UA51000000000030770",
+            "level2": "UA51040000000042921",
+            "level3": "UA51040250000046164",
+            "level4": "UA51040250010015619",
+            "level_extra": NAN,
+            "category": "M",
+            "name": "Татарбунари",
+        },
+        {
+            "level1": "UA51000000000030770",
+            "level2": "UA51040000000042921",
+            "level3": "UA51040250000046164",
+            "level4": "UA51040250020089433",
+            "level_extra": NAN,
+            "category": "C",
+            "name": "Базар'янка",
+        },
+        {
+            "level1": "UA80000000000093317",
+            "level2": NAN,
+            "level3": NAN,
+            "level4": NAN,
+            "level_extra": NAN,
+            "category": "K",
+            "name": "Київ",
+        },
+        {
+            "level1": "UA80000000000093317",
+            "level2": NAN,
+            "level3": NAN,
+            "level4": NAN,
+            "level_extra": "UA80000000000126643",
+            "category": "B",
+            "name": "Печерський",
+        },
+    ],
+}
+
+
+@pytest.fixture
+def codifier_path(tmp_path):
+    path = tmp_path / "kodifikator.json"
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(CODIFIER, f, ensure_ascii=False)
+    return path
+
+
+@pytest.fixture
+def city_registry(codifier_path, monkeypatch):
+    """Serve the test codifier through the process-wide registry holder."""
+    from core.tools.location import registry
+
+    holder = registry.RegistryHolder(codifier_path)
+    monkeypatch.setattr(registry, "registry_holder", holder)
+    return holder.get()
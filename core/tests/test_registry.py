@@ -0,0 +1,659 @@
+import asyncio
+import datetime
+import json
+import os
+import threading
+
+import pytest
+
+from core.tools.location import snapshot
+from core.tools.location.registry import RegistryHolder
+from core.tools.location.tool import RECORD_FIELDS, CityRegistry
+
+
+def test_registry_holder_shares_and_swaps_snapshot(codifier_path):
+    holder = RegistryHolder(codifier_path)
+    first = holder.get()
+    assert isinstance(first, CityRegistry)
+    assert holder.get() is first  # loaded once, shared afterwards
+
+    swapped = holder._reload()
+    assert swapped is not first
+    assert holder.get() is swapped
+
+
+def test_registry_loads_binary_snapshot(codifier_path, monkeypatch):
+    from_json = CityRegistry(codifier_path)
+    path = snapshot.write_snapshot(codifier_path)
+
+    def no_json(self, path):
+        raise AssertionError("parsed the JSON")
+
+    with monkeypatch.context() as m:
+        m.setattr(CityRegistry, "_load_json", no_json)
+        from_snapshot = CityRegistry(codifier_path)
+    assert from_snapshot.recs == from_json.recs
+    assert from_snapshot.version == from_json.version
+    assert from_snapshot.credit == from_json.credit
+
+    # A changed JSON file makes the snapshot stale
+    with open(codifier_path, "a", encoding="utf-8") as f:
+        f.write("\n")
+    assert snapshot.load_snapshot(codifier_path) is None
+    assert CityRegistry(codifier_path).version != from_json.version
+
+    # So does a damaged one
+    snapshot.write_snapshot(codifier_path)
+    with open(path, "r+b") as f:
+        f.truncate(100)
+    assert snapshot.load_snapshot(codifier_path) is None
+
+
+def test_mapped_registry_matches_in_memory(codifier_path):
+    from core.tools.location.store import MappedCityRegistry, open_mapped_registry
+
+    cr = CityRegistry(codifier_path)
+    mapped = open_mapped_registry(codifier_path)
+    assert isinstance(mapped, MappedCityRegistry)
+    assert mapped.version == cr.version
+    assert mapped.credit == cr.credit
+    for code in map(cr._code_of_key, cr._code_owner):
+        assert mapped._search_by_code(code) == cr._search_by_code(code)
+        assert mapped._ancestor_codes(code) == cr._ancestor_codes(code)
+    for level, parent in [
+        ("region", None),
+        ("district", "UA51000000000030770"),
+        ("unit", "UA51040250000046164"),
+    ]:
+        assert mapped._list_children(level, parent) == cr._list_children(level, parent)
+    chain = ("Одеська", "Білгород-Дністровський", "Татарбунарська", "Татарбунари")
+    assert mapped._get_code(*chain) == cr._get_code(*chain)
+    for query in ["", "а", "ба", "Татар", "київ", "нема"]:
+        for prefix in (False, True):
+            assert mapped._search(query, prefix) == cr._search(query, prefix)
+    assert mapped._list_level_with_cat(
+        "unit", parent_key="First_Level", parent_code="UA51000000000030770"
+    ) == cr._list_level_with_cat(
+        "unit", parent_key="First_Level", parent_code="UA51000000000030770"
+    )
+
+    # A changed codifier file rebuilds the store
+    with open(codifier_path, "a", encoding="utf-8") as f:
+        f.write("\n")
+    assert open_mapped_registry(codifier_path).version != cr.version
+
+
+@pytest.mark.parametrize("backend", ["memory", "mmap"])
+def test_registry_loads_prebuilt_indexes(codifier_path, monkeypatch, backend):
+    import mmap
+
+    from core.tools.location import registry
+    from core.tools.location.store import write_store
+
+    write_store(CityRegistry(codifier_path), codifier_path)
+    monkeypatch.setattr(registry, "registry_backend", backend)
+    built = []
+    monkeypatch.setattr(CityRegistry, "_build_indexes", built.append)
+    loaded = registry.load_registry(codifier_path)
+    assert not built
+    assert isinstance(loaded.store._data, mmap.mmap) == (backend == "mmap")
+    assert loaded._get_code("Одеська", "Білгород-Дністровський", "Татарбунарська")
+
+
+def test_registry_indexed_lookups(codifier_path):
+    cr = CityRegistry(codifier_path)
+    assert cr._get_code("Одеська", "Білгород-Дністровський", "Татарбунарська") == (
+        "UA51040250000046164"
+    )
+    assert cr._get_code("Одеська", "Одеський") is None
+    assert cr._search_by_code("51040250010015619") == (
+        ["Одеська", "Білгород-Дністровський", "Татарбунарська", "Татарбунари"],
+        "UA51040250010015619",
+        "M",
+    )
+    assert cr._search_by_code("UA00000000000000000") is None
+    assert cr._list_level_with_cat(
+        "unit", parent_key="Third_Level", parent_code="UA51040250000046164"
+    ) == [("Базар'янка", "C"), ("Татарбунари", "M")]
+
+
+def test_registry_search_by_name(codifier_path):
+    cr = CityRegistry(codifier_path)
+    assert [code for _, code, _ in cr._search("тарбун")] == ["UA51040250010015619"]
+    assert [code for _, code, _ in cr._search("ар")] == [
+        "UA51040250010015619",
+        "UA51040250020089433",
+    ]
+    assert [code for _, code, _ in cr._search("ба", prefix=True)] == [
+        "UA51040250020089433"
+    ]
+    # Communities and districts of Kyiv are resolved to the city itself
+    assert cr._search("Печер") == [(["Київ"], "UA80000000000093317", "K")]
+
+
+def test_registry_search_pages(codifier_path):
+    cr = CityRegistry(codifier_path)
+    first, after = cr._search_page("ар", limit=1)
+    assert [code for _, code, _ in first] == ["UA51040250010015619"]
+    second, after = cr._search_page("ар", limit=1, after=after)
+    assert [code for _, code, _ in second] == ["UA51040250020089433"]
+    assert after is None
+
+
+def test_registry_children_with_codes(codifier_path):
+    cr = CityRegistry(codifier_path)
+    assert cr._list_children("region") == [
+        ("Київ", "K", "UA80000000000093317"),
+        ("Одеська", "O", "UA51000000000030770"),
+    ]
+    assert cr._list_children("unit", parent_code="UA51040250000046164") == [
+        ("Базар'янка", "C", "UA51040250020089433"),
+        ("Татарбунари", "M", "UA51040250010015619"),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_registry_batch_lookups(codifier_path):
+    cr = CityRegistry(codifier_path)
+    assert await cr.get_codes_many(
+        [("Одеська",), ("Київ",), ("Одеська", "Одеський")]
+    ) == [
+        "UA51000000000030770",
+        "UA80000000000093317",
+        None,
+    ]
+    found = await cr.search_by_codes(["UA80000000000093317", "UA00000000000000000"])
+    assert found == [(["Київ"], "UA80000000000093317", "K"), None]
+    chains = await cr.get_chains_many(cr.recs[:2])
+    assert [code for _, code, _ in chains] == [
+        "UA51000000000030770",
+        "UA51040000000042921",
+    ]
+    ancestors = await cr.ancestor_codes_many(
+        ["ua51040250010015619", "UA51040000000042921", "UA00000000000000000"]
+    )
+    assert ancestors == [
+        [
+            "UA51000000000030770",
+            "UA51040000000042921",
+            "UA51040250000046164",
+            "UA51040250010015619",
+        ],
+        ["UA51000000000030770", "UA51040000000042921"],
+        None,
+    ]
+
+
+@pytest.mark.asyncio
+async def test_registry_chains_of_plain_records(codifier_path):
+    from core.tools.location.store import open_mapped_registry
+
+    for cr in (CityRegistry(codifier_path), open_mapped_registry(codifier_path)):
+        rows = [dict(zip(RECORD_FIELDS, rec.values())) for rec in cr.recs]
+        assert [cr._get_chain(row) for row in rows] == list(cr._chains)
+        assert await cr.get_chain(rows[5]) == await cr.get_chain(cr.recs[5])
+        assert await cr.get_chains_many(rows[:2]) == [cr._chains[0], cr._chains[1]]
+    # A record of another registry is resolved by its codes too
+    assert cr._get_chain(CityRegistry(codifier_path).recs[3]) == cr._chains[3]
+
+
+@pytest.mark.asyncio
+async def test_registry_runs_expensive_calls_off_loop(codifier_path, monkeypatch):
+    cr = CityRegistry(codifier_path)
+    monkeypatch.setattr(cr, "INLINE_COST", 0)
+    thread = await cr._run(1, lambda: threading.current_thread().name)
+    assert thread.startswith("registry-scan")
+    assert await cr._run(0, lambda: threading.current_thread().name) == (
+        threading.current_thread().name
+    )
+
+
+def test_registry_records_keep_irregular_codes(tmp_path):
+    path = tmp_path / "flat.json"
+    rows = [
+        {"Name": "Одеська", "Category": "O", "First_Level": "UA51000000000030770"},
+        {
+            "Name": "Стара",
+            "Category": "M",
+            "First_Level": "UA51000000000030770",
+            "Fourth_Level": "UA51-OLD",
+        },
+    ]
+    path.write_text(json.dumps(rows, ensure_ascii=False), encoding="utf-8")
+    cr = CityRegistry(str(path))
+    assert cr.recs[1]["Fourth_Level"] == "UA51-OLD"
+    assert cr.recs[1].get("Third_Level") == ""
+    assert cr.recs[-1] == cr.recs[1]
+    assert cr._search_by_code("ua51-old") == (["Одеська", "Стара"], "UA51-OLD", "M")
+
+
+def _write_codifier_xlsx(path, data=None):
+    from openpyxl import Workbook
+
+    from core.tests.conftest import CODIFIER
+    from core.tools.location import xsls_to_json
+
+    wb = Workbook()
+    ws = wb.active
+    ws.title = xsls_to_json.SHEET_NAME
+    for _ in range(xsls_to_json.FIRST_DATA_ROW - 1):
+        ws.append(["header"])
+    for rec in CODIFIER["data"] if data is None else data:
+        ws.append(
+            [
+                None if isinstance(rec[col], float) else rec[col]
+                for col in xsls_to_json.COLUMNS
+            ]
+        )
+    ws.append([])
+    wb.save(path)
+
+
+def test_streamed_xlsx_loads_like_json(codifier_path, tmp_path):
+    from core.tests.conftest import CODIFIER
+    from core.tools.location import xsls_to_json
+
+    _write_codifier_xlsx(tmp_path / "codifier.xlsx")
+    save_as = tmp_path / "streamed.json"
+    with open(tmp_path / "codifier.xlsx", "rb") as f:
+        xsls_to_json.write_codifier_json(
+            save_as,
+            CODIFIER["provider"],
+            CODIFIER["order"],
+            xsls_to_json.iter_codifier_rows(f),
+        )
+    assert snapshot.load_snapshot(save_as) is not None
+    streamed = CityRegistry(str(save_as))
+    from_json = CityRegistry(codifier_path)
+    assert streamed.recs == from_json.recs
+    assert streamed.credit == from_json.credit
+
+
+def test_broken_xlsx_keeps_stored_codifier(codifier_path, tmp_path):
+    from core.tests.conftest import CODIFIER
+    from core.tools.location import xsls_to_json
+
+    before = codifier_path.read_bytes()
+
+    def rows(remove_tmp):
+        yield CODIFIER["data"][0]
+        if remove_tmp:
+            for path in tmp_path.glob("*.tmp"):
+                path.unlink()
+        raise ValueError("broken row")
+
+    for remove_tmp in (False, True):
+        # The parse error surfaces, even when the temporary file is gone
+        with pytest.raises(ValueError, match="broken row"):
+            xsls_to_json.write_codifier_json(
+                codifier_path,
+                CODIFIER["provider"],
+                CODIFIER["order"],
+                rows(remove_tmp),
+            )
+        assert codifier_path.read_bytes() == before
+        assert not list(tmp_path.glob("*.tmp"))
+
+
+@pytest.mark.asyncio
+async def test_refresh_job_is_single_flight(codifier_path, monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from core.tests.conftest import CODIFIER
+    from core.tools.location import refresh
+
+    holder = RegistryHolder(codifier_path)
+    monkeypatch.setattr(refresh, "registry_holder", holder)
+    first = holder.get()
+    release = threading.Event()
+    calls = []
+
+    def update(save_as):
+        calls.append(save_as)
+        release.wait(5)
+        codifier = dict(CODIFIER, order=dict(CODIFIER["order"], number="291"))
+        with open(save_as, "w", encoding="utf-8") as f:
+            json.dump(codifier, f, ensure_ascii=False)
+        return {"status": 200, "updated": True, "version": None}
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        monkeypatch.setattr(refresh, "_executor", lambda: executor)
+        monkeypatch.setattr(refresh, "_update", update)
+        job = refresh.start_refresh()
+        joined = refresh.start_refresh()  # coalesced while running
+        assert (joined.id, joined.task) == (job.id, job.task)
+        assert refresh.get_refresh_job(job.id).status == "running"
+        release.set()
+        await job.task
+        assert (job.status, job.result["updated"]) == ("done", True)
+        assert len(calls) == 1
+        assert holder.get() is not first
+        assert holder.get().order["number"] == "291"
+
+        # A failed refresh keeps serving the loaded codifier
+        monkeypatch.setattr(refresh, "_update", lambda save_as: 1 / 0)
+        current = holder.get()
+        failed = refresh.start_refresh()
+        assert failed.id != job.id
+        await failed.task
+        assert failed.status == "failed" and "ZeroDivisionError" in failed.error
+        assert holder.get() is current
+    assert refresh.get_refresh_job(job.id).as_dict() == job.as_dict()
+    assert refresh.get_refresh_job(failed.id).status == "failed"
+    assert refresh.get_refresh_job("unknown") is None
+
+
+@pytest.mark.asyncio
+async def test_refresh_job_is_shared_by_server_processes(codifier_path, monkeypatch):
+    import subprocess
+    import sys
+
+    from core.tools.location import refresh
+
+    monkeypatch.setattr(refresh, "registry_holder", RegistryHolder(codifier_path))
+    monkeypatch.setattr(refresh, "_executor", lambda: None)
+    # A refresh another server process is running
+    other = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    try:
+        running = refresh.RefreshJob()
+        running.pid = other.pid
+        refresh._save_job(running)
+
+        joined = refresh.start_refresh()
+        assert (joined.id, joined.status, joined.task) == (running.id, "running", None)
+        assert refresh.get_refresh_job(running.id).status == "running"
+        waiting = asyncio.create_task(refresh.wait_for_refresh(joined, interval=0.01))
+
+        running.status = "done"
+        running.result = {"updated": True}
+        running.finished_at = datetime.datetime.now()
+        refresh._save_job(running)
+        finished = await asyncio.wait_for(waiting, 5)
+        assert (finished.status, finished.result) == ("done", {"updated": True})
+
+        # A job left running by a process that exited is not joined
+        crashed = refresh.RefreshJob()
+        crashed.pid = other.pid
+        refresh._save_job(crashed)
+    finally:
+        other.kill()
+        other.wait()
+    assert refresh.get_refresh_job(crashed.id).status == "failed"
+    monkeypatch.setattr(refresh, "_update", lambda save_as: 1 / 0)
+    started = refresh.start_refresh()
+    assert started.id != crashed.id and started.task is not None
+    await refresh.wait_for_refresh(started)
+    assert refresh.get_refresh_job(started.id).status == "failed"
+
+
+def test_refresh_imports_without_fcntl(tmp_path, monkeypatch):
+    import importlib.util
+    import sys
+
+    from core.tools.location import refresh, xsls_to_json
+
+    # As on platforms without fcntl: the module loads, updates run unlocked
+    monkeypatch.setitem(sys.modules, "fcntl", None)
+    spec = importlib.util.spec_from_file_location("refresh_nofcntl", refresh.__file__)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    assert module.fcntl is None
+    monkeypatch.setattr(xsls_to_json, "update_codifier", lambda save_as: save_as)
+    save_as = str(tmp_path / "kodifikator.json")
+    assert module._update(save_as) == save_as
+    assert not os.path.exists(f"{save_as}.lock")
+
+
+class _Response:
+    text = ""
+
+    def __init__(self, status_code, content=b"", headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(self.status_code)
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i : i + chunk_size]
+
+
+def test_codifier_update_skips_unchanged_order(tmp_path, monkeypatch):
+    from core.tools.location import xsls_to_json
+
+    _write_codifier_xlsx(tmp_path / "codifier.xlsx")
+    content = (tmp_path / "codifier.xlsx").read_bytes()
+    entry = {
+        "order_title": "Наказ № 290 від 26 листопада 2020 року",
+        "order_number": "290",
+        "order_date": "26 листопада 2020",
+        "pdf_url": "https://mindev.gov.ua/order.pdf",
+        "xlsx_url": "https://mindev.gov.ua/kodifikator.xlsx",
+    }
+    monkeypatch.setattr(xsls_to_json, "get_latest_entry", lambda: dict(entry))
+    sent, responses = [], []
+
+    def request(method):
+        def send(url, headers, **kwargs):
+            sent.append((method, headers))
+            return responses.pop(0)
+
+        return send
+
+    monkeypatch.setattr(xsls_to_json.scraper, "get", request("GET"))
+    monkeypatch.setattr(xsls_to_json.scraper, "head", request("HEAD"))
+    save_as = tmp_path / "kodifikator.json"
+
+    responses.append(_Response(200, content, {"ETag": '"v1"'}))
+    first = xsls_to_json.update_codifier(save_as)
+    assert first["updated"]
+    assert first["version"] == CityRegistry(str(save_as)).version
+    assert [method for method, _ in sent] == ["GET"]
+    assert "If-None-Match" not in sent[-1][1]
+    written = os.stat(save_as).st_mtime_ns
+
+    # Same order: only a conditional HEAD request, the XLSX is not downloaded
+    responses.append(_Response(304))
+    second = xsls_to_json.update_codifier(save_as)
+    assert sent[-1][0] == "HEAD" and sent[-1][1]["If-None-Match"] == '"v1"'
+    assert (second["updated"], second["version"]) == (False, first["version"])
+    # Nor when the server ignores the validators but reports the same file
+    responses.append(_Response(200, headers={"ETag": '"v1"'}))
+    assert not xsls_to_json.update_codifier(save_as)["updated"]
+    responses.append(_Response(200, headers={"Content-Length": str(len(content))}))
+    assert not xsls_to_json.update_codifier(save_as)["updated"]
+    assert [method for method, _ in sent] == ["GET", "HEAD", "HEAD", "HEAD"]
+    # A new ETag downloads it, but the same contents are not parsed again
+    responses.append(_Response(200, headers={"ETag": '"v2"'}))
+    responses.append(_Response(200, content, {"ETag": '"v2"'}))
+    assert not xsls_to_json.update_codifier(save_as)["updated"]
+    assert sent[-1][0] == "GET"
+    assert os.stat(save_as).st_mtime_ns == written
+    # The new validators are kept: the next refresh is a HEAD request again
+    responses.append(_Response(200, headers={"ETag": '"v2"'}))
+    assert not xsls_to_json.update_codifier(save_as)["updated"]
+    assert sent[-1][0] == "HEAD" and sent[-1][1]["If-None-Match"] == '"v2"'
+    assert [method for method, _ in sent[-3:]] == ["HEAD", "GET", "HEAD"]
+    # A failed check is no proof: the conditional GET follows, and its
+    # failure fails the refresh instead of reporting it up to date
+    responses.append(_Response(503))
+    responses.append(_Response(304))
+    assert not xsls_to_json.update_codifier(save_as)["updated"]
+    assert [method for method, _ in sent[-2:]] == ["HEAD", "GET"]
+    assert sent[-1][1]["If-None-Match"] == '"v2"'
+    responses.append(_Response(503))
+    responses.append(_Response(503))
+    with pytest.raises(RuntimeError, match="503"):
+        xsls_to_json.update_codifier(save_as)
+
+    # A new order is downloaded unconditionally
+    entry["order_number"] = "291"
+    responses.append(_Response(200, content))
+    assert xsls_to_json.update_codifier(save_as)["updated"]
+    assert sent[-1][0] == "GET" and "If-None-Match" not in sent[-1][1]
+    assert CityRegistry(str(save_as)).order["number"] == "291"
+    assert not os.path.exists(xsls_to_json.download_path(save_as))
+
+
+def test_codifier_update_reports_changes(codifier_path, tmp_path, monkeypatch):
+    from core.tests.conftest import CODIFIER
+    from core.tools.location import xsls_to_json
+
+    data = [dict(rec) for rec in CODIFIER["data"]]
+    data[3]["name"] = "Татарбунари Нові"
+    data[4]["category"] = "X"
+    del data[6]  # Печерський
+    data.append(dict(data[3], level4="UA51040250030012345", name="Нове"))
+    _write_codifier_xlsx(tmp_path / "codifier.xlsx", data)
+    content = (tmp_path / "codifier.xlsx").read_bytes()
+    entry = {
+        "order_title": "Наказ № 291",
+        "order_number": "291",
+        "order_date": "1 січня 2021",
+        "pdf_url": "https://mindev.gov.ua/order.pdf",
+        "xlsx_url": "https://mindev.gov.ua/kodifikator.xlsx",
+    }
+    monkeypatch.setattr(xsls_to_json, "get_latest_entry", lambda: entry)
+    monkeypatch.setattr(
+        xsls_to_json.scraper,
+        "get",
+        lambda url, headers, stream: _Response(200, content),
+    )
+
+    result = xsls_to_json.update_codifier(codifier_path)
+    assert result["changes"] == {
+        "added": 1,
+        "removed": 1,
+        "renamed": 1,
+        "recategorized": 1,
+        "reparented": 0,
+    }
+    report = xsls_to_json.read_diff_report(codifier_path)
+    assert report["from"]["order"]["number"] == "290"
+    assert report["pinned"] is None
+    assert report["to"] == {
+        "order": xsls_to_json._order_block(entry),
+        "version": result["version"],
+    }
+    assert report["changes"]["added"] == ["UA51040250030012345"]
+    assert report["changes"]["removed"] == ["UA80000000000126643"]
+    assert report["changes"]["renamed"] == [
+        {"code": "UA51040250010015619", "old": "Татарбунари", "new": "Татарбунари Нові"}
+    ]
+    assert report["changes"]["recategorized"] == [
+        {"code": "UA51040250020089433", "old": "C", "new": "X"}
+    ]
+
+
+@pytest.mark.asyncio
+async def test_codifier_versions_pin_and_rollback(codifier_path, tmp_path, monkeypatch):
+    from core.tests.conftest import CODIFIER
+    from core.tools.location import xsls_to_json
+    from core.tools.location.store import store_path
+
+    data = [dict(rec) for rec in CODIFIER["data"]]
+    data[3]["name"] = "Татарбунари Нові"
+    _write_codifier_xlsx(tmp_path / "codifier.xlsx", data)
+    content = (tmp_path / "codifier.xlsx").read_bytes()
+    entry = {
+        "order_title": "Наказ № 291",
+        "order_number": "291",
+        "order_date": "1 січня 2021",
+        "pdf_url": "https://mindev.gov.ua/order.pdf",
+        "xlsx_url": "https://mindev.gov.ua/kodifikator.xlsx",
+    }
+    monkeypatch.setattr(xsls_to_json, "get_latest_entry", lambda: entry)
+    monkeypatch.setattr(
+        xsls_to_json.scraper,
+        "get",
+        lambda url, headers, stream: _Response(200, content),
+    )
+    holder = RegistryHolder(codifier_path)
+    old = holder.get()
+    result = xsls_to_json.update_codifier(codifier_path)
+
+    # Both the replaced order and the new one are stored, with their snapshots
+    # and stores
+    versions = holder.versions
+    assert [v["order"]["number"] for v in versions.versions()] == ["291", "290"]
+    assert versions.get("290")["version"] == old.version
+    assert versions.get("291")["version"] == result["version"]
+    for number in ("290", "291"):
+        assert snapshot.read_header(versions.path_of(number)) is not None
+        assert os.path.exists(store_path(versions.path_of(number)))
+    await holder.reload()
+    assert holder.loaded_version() == result["version"]
+
+    # Rolling back maps the stored store: nothing is parsed or indexed
+    monkeypatch.setattr(
+        CityRegistry, "_load_json", lambda self, path: pytest.fail("JSON parsed")
+    )
+    with monkeypatch.context() as patch:
+        patch.setattr(
+            CityRegistry, "_build_indexes", lambda self: pytest.fail("indexes built")
+        )
+        versions.pin("290")
+        await holder.reload()
+    assert holder.get().version == old.version
+    assert holder.get().order["number"] == "290"
+    assert versions.active_version() == old.version
+    with pytest.raises(KeyError):
+        versions.pin("1")
+
+    # Updates go on while pinned, and their diff names the version served
+    entry["order_number"] = "292"
+    latest = xsls_to_json.update_codifier(codifier_path)
+    assert latest["updated"]
+    report = xsls_to_json.read_diff_report(codifier_path)
+    assert report["from"]["order"]["number"] == "291"
+    assert report["pinned"] == {
+        "order": versions.get("290")["order"],
+        "version": old.version,
+    }
+    assert versions.active_path() == versions.path_of("290")
+
+    # A pinned version is kept beyond the limit and survives newer downloads
+    versions.keep = 1
+    versions.archive(dict(entry, number="293"), "v293")
+    assert [v["order"]["number"] for v in versions.versions()] == ["293", "290"]
+    assert versions.active_path() == versions.path_of("290")
+
+    versions.unpin()
+    await holder.reload()
+    assert holder.loaded_version() == latest["version"]
+
+
+@pytest.mark.asyncio
+async def test_codifier_changes_reach_other_processes(codifier_path, monkeypatch):
+    from core.tests.conftest import CODIFIER
+
+    monkeypatch.setattr(RegistryHolder, "CHECK_INTERVAL", 0)
+    # Two holders on one file stand for two server processes
+    serving, other = RegistryHolder(codifier_path), RegistryHolder(codifier_path)
+    old = serving.get().version
+    assert other.get().version == old
+    serving.versions.archive({"number": "290"}, old)
+    data = [dict(rec) for rec in CODIFIER["data"]]
+    data[3]["name"] = "Татарбунари Нові"
+    # Replaced, never rewritten in place, as the refresh does
+    with open(f"{codifier_path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(dict(CODIFIER, data=data), f, ensure_ascii=False)
+    os.replace(f"{codifier_path}.tmp", codifier_path)
+    new = (await serving.reload()).version
+    other.get()  # refreshed by the other process
+    other._background_reload.join()
+    assert other.get().version == new
+
+    serving.versions.pin("290")
+    await serving.reload()
+    assert other.get().version == new  # swapped in the background
+    other._background_reload.join()
+    assert other.get().version == old
+
+    serving.versions.unpin()
+    other.get()
+    other._background_reload.join()
+    assert other.get().version == new
@@ -1,5 +1,14 @@
 import pytest
 import asyncio
+import datetime
+import json
+from types import SimpleNamespace
+
+from api_v1.air_alert import crud, dependencies
+from api_v1.air_alert.broadcast import AlertBroadcaster
+from api_v1.air_alert.changes import AlertChangeFeed
+from api_v1.air_alert.index import LOCATION_TYPE_FIELDS
+from api_v1.air_alert.schemas import TerritorialOrganization
 from api_v1.air_alert.crud import get_active_alerts
 
 
@@ -24,3 +33,371 @@ async def test_cached_air_alert_limit():
         "Third attempt(new data):",
         third_attempt["timestamp"],
     )
+
+
+def make_alert(**fields):
+    defaults = dict(
+        id=1,
+        location_type="city",
+        location_oblast="Одеська область",
+        location_raion="Білгород-Дністровський район",
+        location_title="м. Татарбунари",
+        location_hromada="Татарбунарська територіальна громада",
+        alert_type="air_raid",
+        started_at=datetime.datetime(2025, 1, 1, 12, 0),
+    )
+    defaults.update(fields)
+    return SimpleNamespace(**defaults)
+
+
+@pytest.fixture
+def fake_alerts_api(monkeypatch):
+    """Replace the upstream alerts API; set .alerts to change what it returns."""
+    api = SimpleNamespace(alerts=[make_alert()], calls=0, error=None)
+
+    async def fake_call_for_air_alert():
+        api.calls += 1
+        if api.error:
+            raise api.error
+        return {
+            "data": SimpleNamespace(alerts=list(api.alerts)),
+            "timestamp": datetime.datetime.now(),
+        }
+
+    monkeypatch.setattr(crud, "call_for_air_alert", fake_call_for_air_alert)
+    monkeypatch.setattr(crud, "active_alerts_cache", {})
+    monkeypatch.setattr(crud, "last_update_time", 0)
+    monkeypatch.setattr(crud, "enriched_alerts_cache", {})
+    monkeypatch.setattr(crud, "poller_running", False)
+    monkeypatch.setattr(crud, "alert_feed", AlertChangeFeed())
+    monkeypatch.setattr(crud, "alert_broadcaster", AlertBroadcaster(queue_size=2))
+    return api
+
+
+@pytest.mark.asyncio
+async def test_alert_code_resolution_is_memoized(city_registry, monkeypatch):
+    alert = make_alert()
+    resolved = []
+    resolve_code = dependencies._resolve_code
+
+    async def counting_resolve_code(*args):
+        resolved.append(args[1:])
+        return await resolve_code(*args)
+
+    monkeypatch.setattr(dependencies, "_resolve_code", counting_resolve_code)
+    for _ in range(3):
+        code = await dependencies._resolve_code_for_alert_obj(alert)
+        assert code == "UA51040250010015619"
+    assert len(resolved) == 1
+
+
+@pytest.mark.asyncio
+async def test_enriched_alerts_rendered_once_per_refresh(
+    city_registry, fake_alerts_api
+):
+    first = await crud.get_enriched_alerts()
+    second = await crud.get_enriched_alerts()
+    assert second["body"] is first["body"]
+    assert fake_alerts_api.calls == 1
+
+    body = json.loads(first["body"])
+    assert body["credit_for_location_data"]["order"]["number"] == "290"
+    assert body["data"][0]["ua_code"] == "UA51040250010015619"
+    assert body["data"][0]["started_at"] == "2025-01-01T12:00:00"
+
+
+@pytest.mark.asyncio
+async def test_cached_alerts_etag_covers_whole_body(fake_alerts_api, monkeypatch):
+    import hashlib
+
+    monkeypatch.setattr(crud, "alerts_poll_interval", 0)
+    await crud.get_active_alerts()
+    rendered = crud.render_cached_alerts()
+    assert crud.render_cached_alerts() is rendered  # once per refresh
+    body = json.loads(rendered["body"])
+    assert [a["id"] for a in body["data"]["alerts"]] == [1]
+    assert crud.get_alerts_etag() == (
+        '"' + hashlib.sha1(rendered["body"]).hexdigest() + '"'
+    )
+
+    # Same alerts, new timestamp: the body changed, so must the ETag
+    await crud.get_active_alerts()
+    assert crud.alert_feed.number == 1
+    assert crud.render_cached_alerts()["body"] != rendered["body"]
+    assert crud.get_alerts_etag() != rendered["etag"]
+
+
+@pytest.mark.asyncio
+async def test_alert_changes_since_version(city_registry, fake_alerts_api, monkeypatch):
+    monkeypatch.setattr(crud, "alerts_poll_interval", 0)
+    full = await crud.get_alert_changes()
+    assert full["reset"] and [a["id"] for a in full["data"]] == [1]
+
+    # Refetching the same alerts does not make a new version
+    await crud.get_alert_changes()
+    assert crud.alert_feed.version == full["version"]
+
+    kyiv = make_alert(id=2, location_title="м. Київ", location_type="city")
+    fake_alerts_api.alerts = [kyiv]
+    await crud.get_active_alerts()
+    fake_alerts_api.alerts = [kyiv, make_alert(id=3, location_title="м. Одеса")]
+    await crud.get_active_alerts()
+    fake_alerts_api.alerts = [make_alert(id=2, location_title="м. Київ", notes="x")]
+    changes = await crud.get_alert_changes(full["version"])
+
+    assert not changes["reset"]
+    assert [a["id"] for a in changes["started"]] == [2]  # 3 started and ended
+    assert [a["id"] for a in changes["ended"]] == [1]
+    assert changes["updated"] == []
+    assert changes["ended"][0]["ua_code"] == "UA51040250010015619"
+
+    latest = await crud.get_alert_changes(changes["version"])
+    assert latest["started"] == latest["ended"] == latest["updated"] == []
+    # Versions of another worker or process are not diffed against
+    assert (await crud.get_alert_changes("0000." + full["version"][-1]))["reset"]
+
+
+@pytest.mark.asyncio
+async def test_alert_queries_use_snapshot_index(city_registry, fake_alerts_api):
+    kyiv = dict(
+        location_type="city",
+        location_oblast="м. Київ",
+        location_raion=None,
+        location_title="м. Київ",
+        location_hromada=None,
+    )
+    fake_alerts_api.alerts = [
+        make_alert(),
+        make_alert(
+            id=2,
+            location_type="oblast",
+            location_title="Одеська область",
+            location_raion=None,
+            location_hromada=None,
+        ),
+        make_alert(id=3, **kyiv),
+    ]
+
+    cities = await crud.filter_by_location_type(TerritorialOrganization.CITY)
+    assert [a["location_title"] for a in cities] == ["м. Татарбунари", "м. Київ"]
+    assert set(cities[0]) == set(LOCATION_TYPE_FIELDS)
+
+    result = await crud.query_alerts(
+        location_type=TerritorialOrganization.CITY, code_prefix="ua51"
+    )
+    assert [a["ua_code"] for a in result["data"]] == ["UA51040250010015619"]
+    result = await crud.query_alerts(oblast="одеська", raion="Білгород-Дністровський")
+    assert [a["location_title"] for a in result["data"]] == ["м. Татарбунари"]
+    result = await crud.query_alerts(code_prefix="UA80")
+    assert [a["location_title"] for a in result["data"]] == ["м. Київ"]
+    assert len((await crud.query_alerts())["data"]) == 3
+    assert fake_alerts_api.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_location_type_groups_outlive_enrichment_failures(
+    city_registry, fake_alerts_api, monkeypatch
+):
+    async def broken_enrichment(alerts_data):
+        raise RuntimeError("codifier unavailable")
+
+    fake_alerts_api.alerts = [make_alert(), make_alert(id=2, location_type="oblast")]
+    monkeypatch.setattr(crud, "refresh_enriched_alerts", broken_enrichment)
+    # Grouping needs only the raw alerts
+    cities = await crud.filter_by_location_type(TerritorialOrganization.CITY)
+    assert cities == [
+        {field: getattr(make_alert(), field) for field in LOCATION_TYPE_FIELDS}
+    ]
+
+
+@pytest.mark.asyncio
+async def test_alert_status_covers_units_below_alert(
+    city_registry, fake_alerts_api, monkeypatch
+):
+    fake_alerts_api.alerts = [
+        make_alert(
+            id=2,
+            location_type="raion",
+            location_title="Білгород-Дністровський район",
+            location_hromada=None,
+        )
+    ]
+    result = await crud.get_alert_status(
+        [
+            "UA51040250020089433",  # Базар'янка, in the raion
+            "UA51000000000030770",  # the oblast itself is not under alert
+            "UA80000000000093317",
+            "UA00000000000000000",
+        ]
+    )
+    status = {item["ua_code"]: item for item in result["data"]}
+    assert status["UA51040250020089433"]["under_alert"]
+    assert status["UA51040250020089433"]["alerts"][0]["ua_code"] == (
+        "UA51040000000042921"
+    )
+    assert not status["UA51000000000030770"]["under_alert"]
+    assert not status["UA80000000000093317"]["under_alert"]
+    assert not status["UA00000000000000000"]["found"]
+
+    # A code missing from the codifier still matches an alert resolved to
+    # it, with or without the "UA" prefix
+    monkeypatch.setattr(
+        city_registry, "_ancestor_codes_many", lambda codes: [None] * len(codes)
+    )
+    result = await crud.get_alert_status(["51040000000042921", "ua51040000000042921"])
+    assert [item["under_alert"] for item in result["data"]] == [True, True]
+    assert not any(item["found"] for item in result["data"])
+
+
+def test_alert_status_rejects_malformed_codes():
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from api_v1.air_alert.views import router
+
+    app = FastAPI()
+    app.include_router(router)
+    client = TestClient(app)
+    assert client.get("/air-alert/status/Київ").status_code == 422
+    response = client.post(
+        "/air-alert/status", json={"codes": ["UA51040250020089433", "UA1"]}
+    )
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"] == ["body", "codes", 1]
+
+
+def test_search_cursor_is_bound_to_codifier_version(city_registry, monkeypatch):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from api_v1.location.views import router
+
+    app = FastAPI()
+    app.include_router(router)
+    client = TestClient(app)
+    search = "/codifier/search/by-name"
+    first = client.get(search, params={"q": "а", "limit": 1}).json()
+    cursor = first["next_cursor"]
+    assert cursor.startswith(city_registry.version[:12] + ":")
+    second = client.get(search, params={"q": "а", "limit": 1, "cursor": cursor})
+    assert second.status_code == 200
+    assert second.json()["data"] != first["data"]
+    assert client.get(search, params={"q": "а", "cursor": "7"}).status_code == 400
+
+    # After a swap the position would point into another codifier
+    monkeypatch.setattr(city_registry, "version", "0" * 40)
+    stale = client.get(search, params={"q": "а", "cursor": cursor, "stream": True})
+    assert stale.status_code == 409
+
+
+def parse_event(event: bytes) -> dict:
+    lines = event.decode().strip("\n").split("\n")
+    fields = dict(line.split(": ", 1) for line in lines)
+    return json.loads(fields["data"])
+
+
+@pytest.mark.asyncio
+async def test_alert_stream_pushes_changes(city_registry, fake_alerts_api):
+    stream = crud.stream_alert_changes()
+    first = parse_event(await stream.__anext__())
+    assert first["reset"] and [a["id"] for a in first["data"]] == [1]
+
+    fake_alerts_api.alerts = [make_alert(), make_alert(id=2, location_title="м. Київ")]
+    async with crud.update_lock:
+        await crud.refresh_active_alerts()
+    pushed = parse_event(await stream.__anext__())
+    assert [a["id"] for a in pushed["started"]] == [2]
+
+    # A subscriber that falls behind drops its backlog and gets the full list
+    for alert_id in range(3, 7):
+        fake_alerts_api.alerts = [make_alert(id=alert_id)]
+        async with crud.update_lock:
+            await crud.refresh_active_alerts()
+    resync = parse_event(await stream.__anext__())
+    assert resync["reset"] and [a["id"] for a in resync["data"]] == [6]
+
+    await stream.aclose()
+    assert not crud.alert_broadcaster.subscribers
+
+
+@pytest.mark.asyncio
+async def test_poller_keeps_last_good_snapshot(
+    city_registry, fake_alerts_api, monkeypatch
+):
+    monkeypatch.setattr(crud, "alerts_poll_interval", 0.01)
+    poller = asyncio.create_task(crud.poll_active_alerts())
+    await asyncio.sleep(0.05)
+    assert crud.poller_running
+    assert fake_alerts_api.calls >= 2
+
+    fake_alerts_api.error = RuntimeError("upstream is down")
+    snapshot = await crud.get_active_alerts()
+    await asyncio.sleep(0.05)
+    # Requests keep getting the last good snapshot without waiting on upstream
+    assert await crud.get_active_alerts() is snapshot
+
+    poller.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await poller
+    assert not crud.poller_running
+
+
+@pytest.mark.asyncio
+async def test_pooled_alerts_client_reuses_connection_and_retries():
+    from aiohttp import web
+    from aiohttp.test_utils import TestServer
+
+    from api_v1.air_alert.client import PooledAlertsClient
+
+    statuses = [500, 200, 304]
+    peers = set()
+
+    async def active_alerts(request):
+        peers.add(request.transport.get_extra_info("peername"))
+        status = statuses.pop(0)
+        if status != 200:
+            return web.Response(status=status)
+        return web.json_response(
+            {
+                "alerts": [{"id": 1, "location_title": "Одеська область"}],
+                "meta": {"last_updated_at": "2025/01/01 12:00:00 +0000"},
+                "disclaimer": "",
+            },
+            headers={"Last-Modified": "Wed, 01 Jan 2025 12:00:00 GMT"},
+        )
+
+    app = web.Application()
+    app.router.add_get("/v1/alerts/active.json", active_alerts)
+    async with TestServer(app) as server:
+        client = PooledAlertsClient(
+            token="token", retries=1, base_url=str(server.make_url(""))
+        )
+        try:
+            first = await client.get_active_alerts()  # 500, then retried
+            second = await client.get_active_alerts()  # 304 from cache
+        finally:
+            await client.close()
+
+    assert [a.location_title for a in first] == ["Одеська область"]
+    assert [a.location_title for a in second] == ["Одеська область"]
+    assert statuses == []
+    assert len(peers) == 1  # one kept-alive connection for all requests
+
+
+def test_pooled_alerts_client_overrides_library_request():
+    import inspect
+
+    from alerts_in_ua import AsyncClient
+
+    from api_v1.air_alert.client import PooledAlertsClient
+
+    # The private method overridden, and the state it relies on, are still the
+    # library's: a changed alerts-in-ua would otherwise bypass the pool
+    assert inspect.signature(PooledAlertsClient._request) == inspect.signature(
+        AsyncClient._request
+    )
+    assert "self._request(" in inspect.getsource(AsyncClient.get_active_alerts)
+    client = AsyncClient(token="token")
+    assert (client.base_url, set(client.headers)) == (
+        "/v1/",
+        {"Accept", "Authorization", "User-Agent"},
+    )
+    assert isinstance(client.cache, dict)
@@ -4,7 +4,7 @@ import pytest
 from httpx import AsyncClient, ASGITransport
 from pathlib import Path
 
-from core.tools.location.xsls_to_json import download_xlsx_and_parse_to_json
+from core.tools.location.xsls_to_json import update_codifier
 from main import app
 from core.config import correct_token
 
@@ -16,10 +16,9 @@ JSON_PATH = PROJECT_ROOT / "core" / "tools" / "location" / "kodifikator.json"
 
 @pytest.fixture(scope="session", autouse=True)
 def ensure_kodifikator_exists():
-    json_path = "core/tools/location/kodifikator.json"
-    if not os.path.exists(json_path):
+    if not os.path.exists(JSON_PATH):
         try:
-            download_xlsx_and_parse_to_json()
+            update_codifier(JSON_PATH)
         except Exception as e:
             pytest.skip(f"Could not download kodifikator: {e}")
 
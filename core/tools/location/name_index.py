@@ -0,0 +1,84 @@
+from array import array
+from bisect import bisect_right
+from typing import Iterator
+
+
+class NameIndex:
+    """
+    Substring index over normalized (stripped, lower-cased) names.
+
+    Every name is split into all n-grams of length 1..GRAM, and each n-gram
+    maps to the ascending list of ids of the names containing it. A query of
+    up to GRAM characters is answered by a single posting list. For a longer
+    query the rarest of its n-grams gives the candidates, and only those are
+    checked with a real substring test.
+    """
+
+    GRAM = 3
+
+    def __init__(self, names: list[tuple[int, str]]):
+        """
+        :param names: (id, normalized name) pairs in ascending id order
+        """
+        # Normalized name by id, None for ids not in the index
+        self._names: list[str | None] = []
+        ids = array("I")
+        postings: dict[str, list[int]] = {}
+        for idx, name in names:
+            self._names.extend([None] * (idx + 1 - len(self._names)))
+            self._names[idx] = name
+            ids.append(idx)
+            grams = {
+                name[i : i + n]
+                for n in range(1, self.GRAM + 1)
+                for i in range(len(name) - n + 1)
+            }
+            for gram in grams:
+                postings.setdefault(gram, []).append(idx)
+        # Compact uint32 posting lists; bisect and iteration work the same
+        self._postings: dict[str, array] = {
+            gram: array("I", posting) for gram, posting in postings.items()
+        }
+        self._all = ids
+
+    def _candidates(self, q: str) -> list[int]:
+        if not q:
+            return self._all
+        if len(q) <= self.GRAM:
+            return self._postings.get(q, [])
+        return min(
+            (
+                self._postings.get(q[i : i + self.GRAM], [])
+                for i in range(len(q) - self.GRAM + 1)
+            ),
+            key=len,
+        )
+
+    def cost(self, q: str) -> int:
+        """Number of candidates a query has to go through."""
+        return len(self._candidates(q))
+
+    def iter_search(
+        self, q: str, prefix: bool = False, after: int = -1
+    ) -> Iterator[int]:
+        """
+        Lazily yield ids of the names containing (or starting with) q, in id
+        order, skipping ids up to and including `after`.
+        """
+        candidates = self._candidates(q)
+        start = bisect_right(candidates, after)
+        # A posting list of the whole query needs no verification
+        exact = not prefix and len(q) <= self.GRAM
+        for pos in range(start, len(candidates)):
+            idx = candidates[pos]
+            if exact:
+                yield idx
+            elif prefix:
+                if self._names[idx].startswith(q):
+                    yield idx
+            elif q in self._names[idx]:
+                yield idx
+
+    def search(self, q: str, prefix: bool = False) -> list[int]:
+        """Return ids of the names containing (or starting with) q, in id order."""
+        return list(self.iter_search(q, prefix=prefix))
@@ -0,0 +1,232 @@
+import asyncio
+import datetime
+import json
+import multiprocessing
+import os
+import uuid
+from contextlib import contextmanager, suppress
+from concurrent.futures import ProcessPoolExecutor
+
+from core.tools.location.registry import registry_holder
+
+try:
+    import fcntl
+except ImportError:  # not POSIX
+    fcntl = None
+
+# The scrape and XLSX parsing are CPU-heavy and synchronous, so they run in a
+# separate process and never hold the event loop or the GIL of the server
+_refresh_executor: ProcessPoolExecutor | None = None
+
+
+def _executor() -> ProcessPoolExecutor:
+    global _refresh_executor
+    if _refresh_executor is None:
+        # Spawned, not forked: the server process has a running loop and threads
+        _refresh_executor = ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _refresh_executor
+
+
+def _update(save_as: str) -> dict:
+    from core.tools.location.xsls_to_json import update_codifier
+
+    if fcntl is None:
+        # No lock across server processes: each writes its own temporary
+        # file and replaces the codifier atomically, so they only repeat work
+        return update_codifier(save_as)
+    # One refresh at a time across all server processes; the next one then
+    # finds the codifier up to date
+    with open(f"{save_as}.lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        return update_codifier(save_as)
+
+
+async def refresh_codifier() -> dict:
+    """
+    Download the latest codifier in a worker process, then swap the new
+    snapshot in unless the loaded one is already current or a version is
+    pinned. Requests keep being served from the current one meanwhile.
+    """
+    loop = asyncio.get_running_loop()
+    result = await loop.run_in_executor(_executor(), _update, registry_holder.path)
+    # Another worker may have updated the file or pinned a version even when
+    # this refresh did not; a pinned version stays active after a download
+    active = await asyncio.to_thread(registry_holder.versions.active_version)
+    if active != registry_holder.loaded_version():
+        await registry_holder.reload()
+    return result
+
+
+class RefreshJob:
+    """
+    One run of the codifier refresh, shared by every request that asked for
+    it in any server process. `task` is set only in the process running it.
+    """
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.status = "running"
+        self.started_at = datetime.datetime.now()
+        self.finished_at: datetime.datetime | None = None
+        self.result: dict | None = None
+        self.error: str | None = None
+        self.pid = os.getpid()
+        self.task: asyncio.Task | None = None
+
+    def as_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RefreshJob":
+        job = cls.__new__(cls)
+        job.id = data["job_id"]
+        job.status = data["status"]
+        job.started_at = datetime.datetime.fromisoformat(data["started_at"])
+        job.finished_at = data["finished_at"] and datetime.datetime.fromisoformat(
+            data["finished_at"]
+        )
+        job.result = data["result"]
+        job.error = data["error"]
+        job.pid = data["pid"]
+        job.task = _tasks.get(job.id)
+        if job.status == "running" and not _is_running(job):
+            # Its server process exited before finishing it
+            job.status = "failed"
+            job.error = "Server process exited"
+        return job
+
+    def to_json(self) -> dict:
+        data = self.as_dict()
+        for key in ("started_at", "finished_at"):
+            data[key] = data[key] and data[key].isoformat()
+        data["pid"] = self.pid
+        return data
+
+
+def _is_running(job: RefreshJob) -> bool:
+    if job.pid == os.getpid():
+        return job.task is not None
+    try:
+        os.kill(job.pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # exists, run by another user
+    return True
+
+
+# Recent jobs of all server processes, by id, oldest first, in a JSON file
+# next to the codifier so that any of them can report on any job
+KEEP_JOBS = 20
+# Jobs run by this process
+_tasks: dict[str, asyncio.Task] = {}
+
+
+def _jobs_path() -> str:
+    return f"{registry_holder.path}.jobs.json"
+
+
+@contextmanager
+def _job_table():
+    """The shared job table, locked while the block reads and changes it."""
+    path = _jobs_path()
+    # Not the update lock: that one is held for the whole refresh
+    with open(f"{path}.lock", "a") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            with open(path, encoding="utf-8") as f:
+                jobs = json.load(f)
+        except (FileNotFoundError, ValueError):
+            jobs = {}
+        before = dict(jobs)
+        yield jobs
+        if jobs == before:
+            return
+        while len(jobs) > KEEP_JOBS:
+            del jobs[next(iter(jobs))]
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(jobs, f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, path)
+
+
+def _save_job(job: RefreshJob) -> None:
+    with _job_table() as jobs:
+        jobs[job.id] = job.to_json()
+
+
+async def _run_job(job: RefreshJob) -> None:
+    try:
+        job.result = await refresh_codifier()
+        job.status = "done"
+    except asyncio.CancelledError:
+        job.status = "cancelled"
+        raise
+    except Exception as e:
+        # The loaded codifier keeps being served
+        print(f"CODIFIER REFRESH FAILED: {e!r}")
+        job.error = repr(e)
+        job.status = "failed"
+    finally:
+        job.finished_at = datetime.datetime.now()
+        _tasks.pop(job.id, None)
+        _save_job(job)
+
+
+def start_refresh() -> RefreshJob:
+    """
+    Start refreshing the codifier in the background. While a refresh is
+    running in any server process, callers get that job instead of starting
+    another one.
+    """
+    with _job_table() as jobs:
+        for data in list(jobs.values()):
+            if data["status"] != "running":
+                continue
+            running = RefreshJob.from_dict(data)
+            if running.status == "running":
+                return running
+            jobs[running.id] = running.to_json()
+        job = RefreshJob()
+        job.task = _tasks[job.id] = asyncio.create_task(_run_job(job))
+        jobs[job.id] = job.to_json()
+    return job
+
+
+def get_refresh_job(job_id: str) -> RefreshJob | None:
+    with _job_table() as jobs:
+        data = jobs.get(job_id)
+    return None if data is None else RefreshJob.from_dict(data)
+
+
+async def wait_for_refresh(job: RefreshJob, interval: float = 0.5) -> RefreshJob:
+    """Wait for a job to finish, in whichever server process it runs."""
+    if job.task is not None:
+        await job.task
+        return job
+    while job.status == "running":
+        await asyncio.sleep(interval)
+        job = get_refresh_job(job.id) or job
+    return job
+
+
+async def shutdown_refresh() -> None:
+    """Cancel a running refresh and stop the worker process."""
+    global _refresh_executor
+    for task in list(_tasks.values()):
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    if _refresh_executor is not None:
+        _refresh_executor.shutdown(wait=False, cancel_futures=True)
+        _refresh_executor = None
@@ -0,0 +1,112 @@
+import asyncio
+import threading
+import time
+from pathlib import Path
+
+from core.config import registry_backend
+from core.tools.location.tool import CityRegistry
+from core.tools.location.versions import VersionStore
+
+DATA_PATH = Path(__file__).parent / "kodifikator.json"
+
+
+def load_registry(path) -> CityRegistry:
+    """
+    Load the codifier from its store, with its indexes prebuilt: mapped and
+    shared by all processes with the "mmap" REGISTRY_BACKEND, a private copy
+    with "memory".
+    """
+    from core.tools.location.store import open_mapped_registry
+
+    return open_mapped_registry(path, shared=registry_backend == "mmap")
+
+
+class RegistryHolder:
+    """
+    Process-wide holder of the loaded CityRegistry.
+
+    The codifier is parsed once and the same registry is shared by every router.
+    A refresh builds a completely new CityRegistry and only then swaps the
+    reference, so readers always get either the old or the new snapshot and
+    never a half-loaded one. Registries are never mutated after construction.
+
+    `path` is where the latest codifier is downloaded to; the one served is
+    the version pinned in `versions`, when there is one. Pins may be set and
+    the codifier refreshed by another server process, so both are checked
+    every CHECK_INTERVAL seconds and a changed codifier is swapped in from a
+    thread.
+    """
+
+    CHECK_INTERVAL = 1.0
+
+    def __init__(self, path=DATA_PATH):
+        self.path = str(path)
+        self.versions = VersionStore(self.path)
+        self._registry: CityRegistry | None = None
+        self._lock = threading.Lock()
+        self._source_state: tuple | None = None
+        self._next_check = 0.0
+        self._background_reload: threading.Thread | None = None
+
+    def get(self) -> CityRegistry:
+        """Return the current snapshot, loading it on first use."""
+        registry = self._registry
+        if registry is None:
+            with self._lock:
+                if self._registry is None:
+                    self._source_state = self.versions.source_state()
+                    self._registry = load_registry(self.versions.active_path())
+                registry = self._registry
+        self._check_source()
+        return registry
+
+    def _check_source(self) -> None:
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.CHECK_INTERVAL
+        state = self.versions.source_state()
+        if state == self._source_state:
+            return
+        with self._lock:
+            if state == self._source_state:
+                return
+            self._source_state = state
+            # Readers keep the current snapshot until the new one is loaded
+            self._background_reload = threading.Thread(
+                target=self._reload_if_changed, name="registry-reload", daemon=True
+            )
+            self._background_reload.start()
+
+    def _reload_if_changed(self) -> None:
+        try:
+            if self.versions.active_version() != self.loaded_version():
+                self._reload()
+        except Exception as e:
+            print(f"CODIFIER NOT RELOADED: {e!r}")
+
+    def loaded_version(self) -> str | None:
+        """Version of the loaded snapshot, without loading one; None before that."""
+        registry = self._registry
+        return None if registry is None else registry.version
+
+    def _reload(self, path=None) -> CityRegistry:
+        if path is None:
+            self._source_state = self.versions.source_state()
+            path = self.versions.active_path()
+        # Parse outside the lock: readers keep using the old snapshot meanwhile
+        registry = load_registry(path)
+        with self._lock:
+            self._registry = registry
+        return registry
+
+    async def reload(self, path=None) -> CityRegistry:
+        """Load the codifier file again and atomically swap in the new snapshot."""
+        return await asyncio.to_thread(self._reload, path)
+
+
+registry_holder = RegistryHolder()
+
+
+def get_city_registry() -> CityRegistry:
+    return registry_holder.get()
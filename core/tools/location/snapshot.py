@@ -0,0 +1,221 @@
+"""
+Compact binary snapshot of the codifier, written next to kodifikator.json.
+
+Layout, all integers little-endian uint32:
+    magic | format version | header length | header (JSON)
+    | string offsets (strings + 1) | strings (UTF-8) | one column per FIELDS
+
+Every distinct string is stored once and records are rows of indexes into that
+string table, so loading needs neither JSON parsing nor NaN handling.
+"""
+
+import hashlib
+import json
+import os
+import struct
+import sys
+from array import array
+
+MAGIC = b"CRSNAP"
+FORMAT_VERSION = 2
+FIELDS = ("level1", "level2", "level3", "level4", "level_extra", "category", "name")
+
+_PREAMBLE = struct.Struct("<6sII")
+
+
+def snapshot_path(json_path) -> str:
+    return os.path.splitext(str(json_path))[0] + ".bin"
+
+
+def file_sha1(path) -> str:
+    """Hash of a file, the version of a codifier JSON file."""
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+class SnapshotBuilder:
+    """
+    Collects codifier records one at a time, so a snapshot can be written
+    while the records are streamed without keeping them around.
+    """
+
+    def __init__(self):
+        # tool.py imports this module
+        from core.tools.location.tool import _safe_value
+
+        self._safe_value = _safe_value
+        self.strings: dict[str, int] = {"": 0}
+        self.columns = [array("I") for _ in FIELDS]
+
+    def add(self, rec: dict) -> None:
+        for column, field in zip(self.columns, FIELDS):
+            value = self._safe_value(rec.get(field))
+            column.append(self.strings.setdefault(value, len(self.strings)))
+
+    def write(self, json_path, provider=None, order=None, download=None) -> str:
+        """Write the snapshot of the JSON file the records were written to."""
+        stat = os.stat(json_path)
+        sha1 = file_sha1(json_path)
+
+        blob = bytearray()
+        offsets = array("I", [0])
+        for value in self.strings:
+            blob += value.encode("utf-8")
+            offsets.append(len(blob))
+
+        header = json.dumps(
+            {
+                # The snapshot is stale once the JSON file changes
+                "source": {
+                    "size": stat.st_size,
+                    "mtime_ns": stat.st_mtime_ns,
+                    "sha1": sha1,
+                },
+                "provider": provider,
+                "order": order,
+                "download": download,
+                "records": len(self.columns[0]),
+                "strings": len(self.strings),
+            },
+            ensure_ascii=False,
+        ).encode("utf-8")
+
+        columns = self.columns
+        if sys.byteorder != "little":
+            offsets.byteswap()
+            columns = [array("I", column) for column in columns]
+            for column in columns:
+                column.byteswap()
+
+        path = snapshot_path(json_path)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)))
+            f.write(header)
+            f.write(offsets.tobytes())
+            f.write(blob)
+            for column in columns:
+                f.write(column.tobytes())
+        os.replace(tmp_path, path)
+        return path
+
+
+def write_snapshot(json_path, codifier: dict | None = None) -> str:
+    """
+    Write the snapshot of a codifier JSON file. Pass the parsed codifier when
+    it is already at hand to skip parsing the file again.
+    """
+    if codifier is None:
+        with open(json_path, "rb") as f:
+            codifier = json.loads(f.read())
+    builder = SnapshotBuilder()
+    for rec in codifier["data"]:
+        builder.add(rec)
+    return builder.write(
+        json_path,
+        codifier.get("provider"),
+        codifier.get("order"),
+        codifier.get("download"),
+    )
+
+
+def _uint32_array(data: bytes, start: int, count: int) -> array:
+    arr = array("I")
+    arr.frombytes(data[start : start + 4 * count])
+    if len(arr) != count:
+        raise ValueError("truncated snapshot")
+    if sys.byteorder != "little":
+        arr.byteswap()
+    return arr
+
+
+def _decode_header(data: bytes) -> tuple[dict, int]:
+    magic, version, header_len = _PREAMBLE.unpack_from(data)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise ValueError("not a codifier snapshot of this version")
+    pos = _PREAMBLE.size + header_len
+    if len(data) < pos:
+        raise ValueError("truncated snapshot")
+    return json.loads(data[_PREAMBLE.size : pos]), pos
+
+
+def _decode(data: bytes) -> tuple[dict, list[str], list[array]]:
+    header, pos = _decode_header(data)
+
+    offsets = _uint32_array(data, pos, header["strings"] + 1)
+    pos += 4 * len(offsets)
+    blob = data[pos : pos + offsets[-1]]
+    if len(blob) != offsets[-1]:
+        raise ValueError("truncated snapshot")
+    strings = [
+        blob[offsets[i] : offsets[i + 1]].decode("utf-8")
+        for i in range(len(offsets) - 1)
+    ]
+    pos += offsets[-1]
+
+    columns = []
+    for _ in FIELDS:
+        columns.append(_uint32_array(data, pos, header["records"]))
+        pos += 4 * header["records"]
+    return header, strings, columns
+
+
+def _is_current(json_path, header: dict) -> bool:
+    source = header["source"]
+    try:
+        stat = os.stat(json_path)
+    except FileNotFoundError:
+        return True  # nothing newer to fall back to
+    return (stat.st_size, stat.st_mtime_ns) == (source["size"], source["mtime_ns"])
+
+
+def read_header(json_path) -> dict | None:
+    """
+    Header of the snapshot of a codifier JSON file (provider, order, download
+    and source blocks), without reading the records. None when the snapshot
+    is missing, unreadable or stale.
+    """
+    path = snapshot_path(json_path)
+    try:
+        with open(path, "rb") as f:
+            data = f.read(_PREAMBLE.size)
+            header_len = _PREAMBLE.unpack_from(data)[2]
+            header, _ = _decode_header(data + f.read(header_len))
+    except FileNotFoundError:
+        return None
+    except (ValueError, KeyError, struct.error) as e:
+        print(f"CODIFIER SNAPSHOT {path} IGNORED: {e}")
+        return None
+    return header if _is_current(json_path, header) else None
+
+
+def load_snapshot(json_path) -> dict | None:
+    """
+    Load the snapshot of a codifier JSON file as {"version", "provider",
+    "order", "strings", "columns"}. Return None when it is missing, unreadable
+    or older than the JSON file, so the caller falls back to the JSON.
+    """
+    path = snapshot_path(json_path)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    try:
+        header, strings, columns = _decode(data)
+    except (ValueError, KeyError, IndexError, struct.error) as e:
+        print(f"CODIFIER SNAPSHOT {path} IGNORED: {e}")
+        return None
+
+    if not _is_current(json_path, header):
+        return None
+    return {
+        "version": header["source"]["sha1"],
+        "provider": header.get("provider"),
+        "order": header.get("order"),
+        "strings": strings,
+        "columns": columns,
+    }
@@ -0,0 +1,485 @@
+"""
+Read-only codifier store served straight from a memory-mapped file.
+
+The file holds a string pool, fixed-width records and every lookup index of
+CityRegistry as sorted integer arrays. All worker processes map the same file,
+so they share one copy of its pages, and lookups read the buffer directly
+instead of going through per-process dicts. Results are decoded on access.
+Loading it needs no parsing or index building, so the memory backend reads
+it too, into a private copy instead of a shared mapping.
+
+Layout: magic | format version | header length | header (JSON) | sections,
+each aligned to 8 bytes and described in the header as [offset, typecode,
+length]. Keys of the composite indexes are packed into uint64 as
+(high << 56) | (middle << 28) | low, with string ids as the parts; nullable
+string ids are stored as id + 1 with 0 for None.
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+
+from core.tools.location.name_index import NameIndex
+from core.tools.location.tool import CityRegistry, RecordList, _safe_value
+
+MAGIC = b"CRSTOR"
+FORMAT_VERSION = 1
+
+_PREAMBLE = struct.Struct("<6sII")
+
+LEVELS = ("region", "district", "community", "unit")
+# Record fields in the order of the fixed-width record section
+FIELDS = (
+    "First_Level",
+    "Second_Level",
+    "Third_Level",
+    "Fourth_Level",
+    "Category",
+    "Name",
+)
+_FIELD_INDEX = {field: i for i, field in enumerate(FIELDS)}
+_PARENT_KEYS = (None, "First_Level", "Second_Level", "Third_Level")
+# count, up to four names, code, category
+_CHAIN_WIDTH = 7
+
+
+def store_path(json_path) -> str:
+    return os.path.splitext(str(json_path))[0] + ".store"
+
+
+def _key(high: int, middle: int = 0, low: int = 0) -> int:
+    return (high << 56) | (middle << 28) | low
+
+
+class _StringPool:
+    def __init__(self):
+        self.ids: dict[str, int] = {"": 0}
+
+    def id(self, value: str) -> int:
+        return self.ids.setdefault(value, len(self.ids))
+
+    def nullable(self, value) -> int:
+        return 0 if value is None else self.id(value) + 1
+
+
+def write_store(cr: CityRegistry, json_path) -> str:
+    """Write the store for a registry loaded from the given codifier file."""
+    pool = _StringPool()
+    sections: dict[str, array] = {}
+
+    def nullable_code(key) -> int:
+        return 0 if key is None else pool.id(cr._code_of_key(key)) + 1
+
+    records = array("I")
+    for i in range(len(cr.recs)):
+        records.extend(pool.id(cr._field(i, field)) for field in FIELDS)
+    sections["records"] = records
+
+    def table(name: str, items):
+        keys, values = array("Q"), array("I")
+        for key, value in sorted(items):
+            keys.append(key)
+            values.append(value)
+        sections[name + "_keys"] = keys
+        sections[name + "_values"] = values
+
+    def ranges(name: str, groups, encode):
+        # Each key maps to a [start, end) range of fixed-width entries
+        keys, starts, entries = array("Q"), array("I"), array("I")
+        for key, items in sorted(groups):
+            keys.append(key)
+            starts.append(len(entries))
+            for item in items:
+                entries.extend(encode(item))
+        starts.append(len(entries))
+        sections[name + "_keys"] = keys
+        sections[name + "_starts"] = starts
+        sections[name + "_entries"] = entries
+
+    table(
+        "by_code",
+        (
+            (_key(LEVELS.index(level), 0, pool.id(cr._code_of_key(code))), idx)
+            for level, by_code in cr._by_code.items()
+            for code, idx in by_code.items()
+        ),
+    )
+    table(
+        "by_name",
+        (
+            (_key(LEVELS.index(level), nullable_code(parent), pool.id(name)), idx)
+            for (level, parent, name), idx in cr._by_name.items()
+        ),
+    )
+    table(
+        "code_owner",
+        # Stored without the "UA" prefix, see CityRegistry._owner_key()
+        (
+            (pool.id(cr._code_of_key(code)[2:]), idx)
+            for code, idx in cr._code_owner.items()
+        ),
+    )
+    children = [
+        (level, parent_key, None if parent is None else cr._code_of_key(parent))
+        for level, parent_key, parent in cr._children
+    ]
+    ranges(
+        "children",
+        (
+            (
+                _key(
+                    LEVELS.index(level) * 4 + _PARENT_KEYS.index(parent_key),
+                    nullable_code(parent),
+                ),
+                cr._children_of(level, parent_key, parent),
+            )
+            for level, parent_key, parent in children
+        ),
+        lambda item: (pool.id(item[0]), pool.id(item[1])),
+    )
+    ranges(
+        "children_codes",
+        (
+            (
+                _key(LEVELS.index(level), nullable_code(parent)),
+                cr._children_with_codes_of(level, parent),
+            )
+            for level, parent_key, parent in children
+            if parent_key == CityRegistry.PARENT_KEY[level]
+        ),
+        lambda item: (pool.id(item[0]), pool.id(item[1]), pool.nullable(item[2])),
+    )
+
+    chains = array("I")
+    for chain, code, cat in cr._chains:
+        names = [pool.id(name) for name in chain]
+        chains.append(len(names))
+        chains.extend(names + [0] * (4 - len(names)))
+        chains.extend((pool.id(code), pool.id(_safe_value(cat))))
+    sections["chains"] = chains
+
+    name_index = cr._name_index
+    # The empty gram lists every searchable record, as an empty query does
+    postings = {"": name_index._all, **name_index._postings}
+    ranges(
+        "grams",
+        ((pool.id(gram), ids) for gram, ids in postings.items()),
+        lambda idx: (idx,),
+    )
+    names = array("I", [0]) * len(cr.recs)
+    for idx, name in enumerate(name_index._names):
+        if name is not None:
+            names[idx] = pool.id(name) + 1
+    sections["search_names"] = names
+
+    blob = bytearray()
+    offsets = array("I", [0])
+    for value in pool.ids:
+        blob += value.encode("utf-8")
+        offsets.append(len(blob))
+    sections["string_offsets"] = offsets
+    sections["string_blob"] = array("B", blob)
+    # String ids in byte order, to find the id of a string by bisection
+    encoded = [value.encode("utf-8") for value in pool.ids]
+    sections["string_order"] = array(
+        "I", sorted(range(len(encoded)), key=encoded.__getitem__)
+    )
+
+    stat = os.stat(json_path)
+    layout = {}
+    position = 0
+    for name, arr in sections.items():
+        layout[name] = [position, arr.typecode, len(arr)]
+        position += -(-len(arr) * arr.itemsize // 8) * 8
+    header = json.dumps(
+        {
+            # The store is stale once the JSON file changes
+            "source": {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns},
+            "byteorder": sys.byteorder,
+            "version": cr.version,
+            "provider": cr.provider,
+            "order": cr.order,
+            "sections": layout,
+        },
+        ensure_ascii=False,
+    ).encode("utf-8")
+    start = -(-(_PREAMBLE.size + len(header)) // 8) * 8
+
+    path = store_path(json_path)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)))
+        f.write(header)
+        for name, arr in sections.items():
+            f.seek(start + layout[name][0])
+            f.write(arr.tobytes())
+        f.truncate(start + position)
+    os.replace(tmp_path, path)
+    return path
+
+
+class MappedStore:
+    """
+    Sections of a store file, as typed views of one shared read-only mapping,
+    or of a private copy of the file when not `shared`.
+    """
+
+    def __init__(self, path: str, shared: bool = True):
+        with open(path, "rb") as f:
+            if shared:
+                self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self._data = f.read()
+        buffer = memoryview(self._data)
+        magic, version, header_len = _PREAMBLE.unpack_from(buffer)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError("not a codifier store of this version")
+        self.header = json.loads(
+            bytes(buffer[_PREAMBLE.size : _PREAMBLE.size + header_len])
+        )
+        if self.header["byteorder"] != sys.byteorder:
+            raise ValueError("codifier store written on another platform")
+
+        start = -(-(_PREAMBLE.size + header_len) // 8) * 8
+        for name, (offset, typecode, length) in self.header["sections"].items():
+            itemsize = array(typecode).itemsize
+            begin = start + offset
+            section = buffer[begin : begin + length * itemsize]
+            if len(section) != length * itemsize:
+                raise ValueError("truncated codifier store")
+            setattr(self, name, section.cast(typecode))
+        # Slicing the data itself is the cheapest way to read the strings
+        self._blob_start = start + self.header["sections"]["string_blob"][0]
+
+    def _string_bytes(self, string_id: int) -> bytes:
+        base = self._blob_start
+        offsets = self.string_offsets
+        return self._data[base + offsets[string_id] : base + offsets[string_id + 1]]
+
+    def string(self, string_id: int) -> str:
+        return self._string_bytes(string_id).decode("utf-8")
+
+    def nullable_string(self, value: int) -> str | None:
+        return None if value == 0 else self.string(value - 1)
+
+    def string_id(self, value) -> int | None:
+        """Id of a string in the pool, None if the store does not contain it."""
+        if not isinstance(value, str):
+            return None
+        target = value.encode("utf-8")
+        order = self.string_order
+        lo, hi = 0, len(order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._string_bytes(order[mid]) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(order) and self._string_bytes(order[lo]) == target:
+            return order[lo]
+        return None
+
+    def nullable_id(self, value) -> int | None:
+        """Nullable encoding of a string, None if the store does not contain it."""
+        if value is None:
+            return 0
+        string_id = self.string_id(value)
+        return None if string_id is None else string_id + 1
+
+    def find(self, keys, key: int) -> int | None:
+        pos = bisect_left(keys, key)
+        if pos < len(keys) and keys[pos] == key:
+            return pos
+        return None
+
+
+class _Chains:
+    """Precomputed (chain, code, category) of every record."""
+
+    def __init__(self, store: MappedStore):
+        self._store = store
+
+    def __len__(self) -> int:
+        return len(self._store.chains) // _CHAIN_WIDTH
+
+    def __getitem__(self, idx: int) -> tuple[list[str], str, str]:
+        store = self._store
+        base = idx * _CHAIN_WIDTH
+        row = store.chains[base : base + _CHAIN_WIDTH]
+        names = [store.string(name_id) for name_id in row[1 : 1 + row[0]]]
+        return names, store.string(row[5]), store.string(row[6])
+
+
+class _SearchNames:
+    def __init__(self, store: MappedStore):
+        self._store = store
+
+    def __getitem__(self, idx: int) -> str:
+        return self._store.nullable_string(self._store.search_names[idx])
+
+
+class MappedNameIndex(NameIndex):
+    """NameIndex reading its posting lists from the store."""
+
+    def __init__(self, store: MappedStore):
+        self._store = store
+        self._names = _SearchNames(store)
+
+    def _postings_of(self, gram: str):
+        store = self._store
+        gram_id = store.string_id(gram)
+        pos = None if gram_id is None else store.find(store.grams_keys, gram_id)
+        if pos is None:
+            return []
+        return store.grams_entries[
+            store.grams_starts[pos] : store.grams_starts[pos + 1]
+        ]
+
+    def _candidates(self, q: str):
+        if len(q) <= self.GRAM:
+            return self._postings_of(q)
+        return min(
+            (
+                self._postings_of(q[i : i + self.GRAM])
+                for i in range(len(q) - self.GRAM + 1)
+            ),
+            key=len,
+        )
+
+
+class MappedCityRegistry(CityRegistry):
+    """
+    CityRegistry whose records and indexes live in a memory-mapped store, so
+    that worker processes share them. Lookups behave exactly as in memory.
+    """
+
+    def __init__(self, path: str, store: MappedStore):
+        self.path = path
+        self.store = store
+        header = store.header
+        self.version = header["version"]
+        self.provider = header["provider"]
+        self.order = header["order"]
+        self.credit = {"provider": self.provider, "order": self.order}
+        self.credit_json = json.dumps(self.credit, ensure_ascii=False)
+
+        self.recs = RecordList(self, len(store.records) // len(FIELDS))
+        self._chains = _Chains(store)
+        self._name_index = MappedNameIndex(store)
+
+    def _field(self, idx: int, key: str) -> str:
+        return self.store.string(
+            self.store.records[idx * len(FIELDS) + _FIELD_INDEX[key]]
+        )
+
+    def _record_of_code(self, level: str, code: str) -> int | None:
+        store = self.store
+        code_id = store.string_id(code)
+        if code_id is None:
+            return None
+        pos = store.find(store.by_code_keys, _key(LEVELS.index(level), 0, code_id))
+        return None if pos is None else store.by_code_values[pos]
+
+    def _record_of_name(
+        self, level: str, parent_code: str | None, name: str
+    ) -> int | None:
+        store = self.store
+        parent_id = store.nullable_id(parent_code)
+        name_id = store.string_id(name)
+        if parent_id is None or name_id is None:
+            return None
+        pos = store.find(
+            store.by_name_keys, _key(LEVELS.index(level), parent_id, name_id)
+        )
+        return None if pos is None else store.by_name_values[pos]
+
+    def _owner_of(self, ua_code: str) -> int | None:
+        store = self.store
+        code = (ua_code or "").strip().upper()
+        code_id = store.string_id(code[2:] if code.startswith("UA") else code)
+        if not code_id:
+            return None  # unknown or empty
+        pos = store.find(store.code_owner_keys, code_id)
+        return None if pos is None else store.code_owner_values[pos]
+
+    def _children_of(
+        self, level: str, parent_key: str | None, parent_code: str | None
+    ) -> list[tuple[str, str]]:
+        store = self.store
+        parent_id = store.nullable_id(parent_code)
+        if parent_key not in _PARENT_KEYS or parent_id is None:
+            return []
+        pos = store.find(
+            store.children_keys,
+            _key(LEVELS.index(level) * 4 + _PARENT_KEYS.index(parent_key), parent_id),
+        )
+        if pos is None:
+            return []
+        entries = store.children_entries
+        return [
+            (store.string(entries[i]), store.string(entries[i + 1]))
+            for i in range(
+                store.children_starts[pos], store.children_starts[pos + 1], 2
+            )
+        ]
+
+    def _children_with_codes_of(
+        self, level: str, parent_code: str | None
+    ) -> list[tuple[str, str, str | None]]:
+        store = self.store
+        parent_id = store.nullable_id(parent_code)
+        if parent_id is None:
+            return []
+        pos = store.find(
+            store.children_codes_keys, _key(LEVELS.index(level), parent_id)
+        )
+        if pos is None:
+            return []
+        entries = store.children_codes_entries
+        return [
+            (
+                store.string(entries[i]),
+                store.string(entries[i + 1]),
+                store.nullable_string(entries[i + 2]),
+            )
+            for i in range(
+                store.children_codes_starts[pos],
+                store.children_codes_starts[pos + 1],
+                3,
+            )
+        ]
+
+
+def _open_current(path: str, json_path, shared: bool) -> MappedStore | None:
+    try:
+        store = MappedStore(path, shared)
+    except FileNotFoundError:
+        return None
+    except (ValueError, KeyError, struct.error) as e:
+        print(f"CODIFIER STORE {path} IGNORED: {e}")
+        return None
+    source = store.header["source"]
+    try:
+        stat = os.stat(json_path)
+    except FileNotFoundError:
+        return store  # nothing newer to rebuild from
+    if (stat.st_size, stat.st_mtime_ns) != (source["size"], source["mtime_ns"]):
+        return None
+    return store
+
+
+def open_mapped_registry(json_path, shared: bool = True) -> MappedCityRegistry:
+    """
+    Map the store of a codifier file, or read a private copy of it when not
+    `shared`, first (re)building it from the file when it is missing or stale.
+    """
+    path = store_path(json_path)
+    store = _open_current(path, json_path, shared)
+    if store is None:
+        write_store(CityRegistry(str(json_path)), json_path)
+        store = MappedStore(path, shared)
+    return MappedCityRegistry(str(json_path), store)
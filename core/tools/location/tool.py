@@ -1,6 +1,146 @@
+import hashlib
 import json
 import asyncio
 import math
+from array import array
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+from typing import Iterator
+
+from core.config import registry_scan_workers
+from core.tools.location.name_index import NameIndex
+from core.tools.location.snapshot import load_snapshot
+
+# Bounded pool for lookups too expensive to run on the event loop
+_scan_executor = ThreadPoolExecutor(
+    max_workers=registry_scan_workers, thread_name_prefix="registry-scan"
+)
+
+
+def _safe_value(val) -> str:
+    """Keep None/NaN as empty string, cast integer-like floats to int, keep strings."""
+    if val is None or (isinstance(val, float) and math.isnan(val)):
+        return ""
+    return str(int(val)) if isinstance(val, float) and val.is_integer() else str(val)
+
+
+def _code_key(code: str) -> int | str:
+    """
+    Compact key of a level code: "UA" and up to 17 digits becomes an int (with
+    a leading 1 to keep leading zeros), "" becomes 0, anything else stays as is.
+    """
+    if not code:
+        return 0
+    digits = code[2:]
+    if (
+        code.startswith("UA")
+        and 0 < len(digits) <= 17
+        and digits.isascii()
+        and digits.isdigit()
+    ):
+        return int("1" + digits)
+    return code
+
+
+def _lookup_key(code) -> int | str | None:
+    # Codes passed in by callers may be None
+    return _code_key(code) if isinstance(code, str) else code
+
+
+RECORD_FIELDS = (
+    "Name",
+    "Category",
+    "First_Level",
+    "Second_Level",
+    "Third_Level",
+    "Fourth_Level",
+)
+
+
+class Record:
+    """
+    Read-only view of one codifier record, with the dict-style access of the
+    raw rows (rec["Name"], rec.get("First_Level")). Values are read from the
+    registry on access.
+    """
+
+    __slots__ = ("registry", "index")
+
+    def __init__(self, registry: "CityRegistry", index: int):
+        self.registry = registry
+        self.index = index
+
+    def get(self, key: str, default=None):
+        if key not in RECORD_FIELDS:
+            return default
+        return self.registry._field(self.index, key)
+
+    def __getitem__(self, key: str) -> str:
+        if key not in RECORD_FIELDS:
+            raise KeyError(key)
+        return self.registry._field(self.index, key)
+
+    def values(self) -> tuple[str, ...]:
+        return tuple(self.registry._field(self.index, key) for key in RECORD_FIELDS)
+
+    def __eq__(self, other) -> bool:
+        # Equal when the values are, like the rows it stands for
+        if isinstance(other, Record):
+            if self.registry is other.registry and self.index == other.index:
+                return True
+            return self.values() == other.values()
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash(self.values())
+
+    def __repr__(self) -> str:
+        return f"Record({ {key: self.get(key) for key in RECORD_FIELDS} })"
+
+
+class RecordList(Sequence):
+    """The records of a registry, in codifier order."""
+
+    def __init__(self, registry: "CityRegistry", count: int):
+        self._registry = registry
+        self._count = count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [Record(self._registry, i) for i in range(*idx.indices(self._count))]
+        if idx < 0:
+            idx += self._count
+        if not 0 <= idx < self._count:
+            raise IndexError("record index out of range")
+        return Record(self._registry, idx)
+
+    def __iter__(self) -> Iterator[Record]:
+        registry = self._registry
+        for idx in range(self._count):
+            yield Record(registry, idx)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, RecordList):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+
+class ChainList(Sequence):
+    """(chain, code, category) of every record, built on access."""
+
+    def __init__(self, registry: "CityRegistry"):
+        self._registry = registry
+
+    def __len__(self) -> int:
+        return len(self._registry.recs)
+
+    def __getitem__(self, idx: int) -> tuple[list[str], str, str]:
+        return self._registry._chain_at(idx)
 
 
 class CityRegistry:
@@ -11,6 +151,21 @@ class CityRegistry:
         "unit": ("C", "M", "X"),
     }
 
+    LEVEL_KEY = {
+        "region": "First_Level",
+        "district": "Second_Level",
+        "community": "Third_Level",
+        "unit": "Fourth_Level",
+    }
+
+    # Key holding the code of the parent unit for every level
+    PARENT_KEY = {
+        "region": None,
+        "district": "First_Level",
+        "community": "Second_Level",
+        "unit": "Third_Level",
+    }
+
     CATEGORY_LABEL = {
         "O": "область",
         "K": "місто зі спец. статусом",
@@ -21,64 +176,302 @@ class CityRegistry:
         "X": "селище",
     }
 
+    # Position of every level code in a record's row of codes
+    LEVEL_POS = {key: pos for pos, key in enumerate(LEVEL_KEY.values())}
+
+    # Calls touching at most this many records/candidates run inline
+    INLINE_COST = 2000
+
     def __init__(self, path: str):
         self.path = path
-        with open(path, encoding="utf-8") as f:
-            raw = json.load(f)
+        snapshot = load_snapshot(path)
+        if snapshot is not None:
+            self._load_snapshot(snapshot)
+        else:
+            self._load_json(path)
+        # Credit block returned with every codifier response, built once per file
+        self.credit = {"provider": self.provider, "order": self.order}
+        self.credit_json = json.dumps(self.credit, ensure_ascii=False)
+        self._build_indexes()
+
+    def _load_json(self, path: str) -> None:
+        with open(path, "rb") as f:
+            content = f.read()
+        # Identifies the codifier contents, e.g. to invalidate caches built on it
+        self.version = hashlib.sha1(content).hexdigest()
+        raw = json.loads(content)
         if isinstance(raw, dict) and "data" in raw and isinstance(raw["data"], list):
             # store metadata if present
             self.provider = raw.get("provider")
             self.order = raw.get("order")
 
-            def safe_val(v):
-                # keep None/NaN as empty string, keep strings as-is
-                if v is None:
-                    return ""
-                if isinstance(v, float):
-                    try:
-                        if math.isnan(v):
-                            return ""
-                    except Exception:
-                        pass
-                    # if float that is integer-like, cast to int then str
-                    return str(int(v)) if v.is_integer() else str(v)
-                return str(v)
-
-            self.recs = [
-                {
-                    "Name": (rec.get("name") or ""),
-                    "Category": (rec.get("category") or ""),
-                    "First_Level": safe_val(rec.get("level1")),
-                    "Second_Level": safe_val(rec.get("level2")),
-                    "Third_Level": safe_val(rec.get("level3")),
-                    "Fourth_Level": safe_val(rec.get("level4")),
-                }
+            self._set_records(
+                (
+                    rec.get("name") or "",
+                    _safe_value(rec.get("category")),
+                    _safe_value(rec.get("level1")),
+                    _safe_value(rec.get("level2")),
+                    _safe_value(rec.get("level3")),
+                    _safe_value(rec.get("level4")),
+                )
                 for rec in raw["data"]
-            ]
+            )
         else:
             # Assume it's already a flat list in the expected schema
-            self.recs = raw
+            self._set_records(
+                (
+                    rec.get("Name") or "",
+                    _safe_value(rec.get("Category")),
+                    *(_safe_value(rec.get(key)) for key in self.LEVEL_KEY.values()),
+                )
+                for rec in raw
+            )
             self.provider = None
             self.order = None
 
+    def _load_snapshot(self, snapshot: dict) -> None:
+        # Same version as the JSON file the snapshot was written from
+        self.version = snapshot["version"]
+        self.provider = snapshot["provider"]
+        self.order = snapshot["order"]
+        strings = snapshot["strings"]
+        self._set_records(
+            (
+                strings[name],
+                strings[category],
+                strings[level1],
+                strings[level2],
+                strings[level3],
+                strings[level4],
+            )
+            for level1, level2, level3, level4, _, category, name in zip(
+                *snapshot["columns"]
+            )
+        )
+
+    def _set_records(self, rows) -> None:
+        """
+        Store (name, category, level1..level4) rows column-wise: names and
+        categories as ids into tables of distinct values, level codes as ints
+        (see _code_key) with negative ids into a table of irregular codes.
+        """
+        names: dict[str, int] = {}
+        categories: dict[str, int] = {}
+        odd_codes: dict[str, int] = {}
+        name_ids = array("I")
+        category_ids = array("H")
+        codes = array("q")
+        for name, category, *levels in rows:
+            name_ids.append(names.setdefault(name, len(names)))
+            category_ids.append(categories.setdefault(category, len(categories)))
+            for code in levels:
+                key = _code_key(code)
+                if isinstance(key, str):
+                    key = -1 - odd_codes.setdefault(key, len(odd_codes))
+                codes.append(key)
+
+        self._names = list(names)
+        self._name_ids = name_ids
+        self._categories = list(categories)
+        self._category_ids = category_ids
+        self._odd_codes = list(odd_codes)
+        # Four level codes per record, in LEVEL_KEY order
+        self._codes = codes
+        self.recs = RecordList(self, len(name_ids))
+
+    def _field(self, idx: int, key: str) -> str:
+        """Value of a record field, as in the codifier rows."""
+        if key == "Name":
+            return self._names[self._name_ids[idx]]
+        if key == "Category":
+            return self._categories[self._category_ids[idx]]
+        return self._decode_code(self._codes[4 * idx + self.LEVEL_POS[key]])
+
+    def _decode_code(self, value: int) -> str:
+        if value > 0:
+            return "UA" + str(value)[1:]
+        if value == 0:
+            return ""
+        return self._odd_codes[-1 - value]
+
+    def _code_of_key(self, key: int | str) -> str:
+        return key if isinstance(key, str) else self._decode_code(key)
+
+    @staticmethod
+    def _owner_key(ua_code: str) -> int | str:
+        # Codes are matched without the "UA" prefix, case-insensitively
+        code = ua_code.strip().upper()
+        return _code_key("UA" + (code[2:] if code.startswith("UA") else code))
+
+    def _build_indexes(self) -> None:
+        """
+        Build lookup tables once, so that lookups never scan all records.
+        Where several records match, the first one wins, as with a linear scan.
+        Tables hold record indexes and are keyed by _code_key of the codes.
+        """
+        cat_level = {
+            cat: level for level, cats in self.LEVEL_CAT.items() for cat in cats
+        }
+        # level -> code on that level -> record
+        self._by_code: dict[str, dict[int | str, int]] = {
+            level: {} for level in self.LEVEL_CAT
+        }
+        # (level, parent code, name) -> record
+        self._by_name: dict[tuple[str, int | str | None, str], int] = {}
+        # code without "UA" prefix -> first record having it on any level
+        self._code_owner: dict[int | str, int] = {}
+        # (level, parent key, parent code) -> {name: record}, the last record
+        # with a name giving its category
+        children: dict[tuple[str, str | None, int | str | None], dict[str, int]] = {}
+
+        codes = self._codes
+        for i in range(len(self.recs)):
+            row = codes[4 * i : 4 * i + 4]
+            for value in row:
+                if value > 0:
+                    self._code_owner.setdefault(value, i)
+                elif value < 0:
+                    code = self._odd_codes[-1 - value].strip().upper()
+                    if code.removeprefix("UA"):
+                        self._code_owner.setdefault(self._owner_key(code), i)
+
+            cat = self._categories[self._category_ids[i]]
+            level = cat_level.get(cat)
+            if level is None:
+                continue
+            code = row[self.LEVEL_POS[self.LEVEL_KEY[level]]]
+            if code:
+                self._by_code[level].setdefault(self._row_key(code), i)
+
+            name = self._names[self._name_ids[i]].strip()
+            parent_key = self.PARENT_KEY[level]
+            parent_code = (
+                self._row_key(row[self.LEVEL_POS[parent_key]]) if parent_key else None
+            )
+            self._by_name.setdefault((level, parent_code, name), i)
+
+            if name:
+                children.setdefault((level, None, None), {})[name] = i
+                if parent_key:
+                    children.setdefault((level, parent_key, parent_code), {})[name] = i
+
+        # Same key -> records of the distinct child names, sorted by name
+        self._children: dict[tuple, array] = {
+            key: array(
+                "I", (i for _, i in sorted(items.items(), key=lambda ni: ni[0].lower()))
+            )
+            for key, items in children.items()
+        }
+
+        # Per record: the records naming its region, district, community and
+        # unit (-1 where there is none), and the category id of its chain
+        self._chain_recs = array("i")
+        self._chain_cats = array("H")
+        for i in range(len(self.recs)):
+            cat_id = self._category_ids[i]
+            for level, value in zip(self.LEVEL_KEY, codes[4 * i : 4 * i + 4]):
+                j = self._by_code[level].get(self._row_key(value)) if value else None
+                self._chain_recs.append(-1 if j is None else j)
+                if j is None:
+                    continue
+                if level == "unit" or (
+                    level == "region" and self._categories[self._category_ids[j]] == "K"
+                ):
+                    cat_id = self._category_ids[j]
+            self._chain_cats.append(cat_id)
+
+        # (chain, code, category) of every record, in the order of self.recs
+        self._chains = ChainList(self)
+
+        # Only settlements with a valid code can be found by name
+        searchable = []
+        normalized: dict[str, str] = {}  # one string per distinct name
+        for i in range(len(self.recs)):
+            chain, code, cat = self._chains[i]
+            if cat in ("C", "M", "X", "K") and code and code != "nan":
+                name = self._norm(self._field(i, "Name"))
+                searchable.append((i, normalized.setdefault(name, name)))
+        self._name_index = NameIndex(searchable)
+
+    def _row_key(self, value: int) -> int | str:
+        # Lookup key of a level code column value
+        return value if value >= 0 else self._odd_codes[-1 - value]
+
+    def _record_of_code(self, level: str, code: str) -> int | None:
+        return self._by_code[level].get(_lookup_key(code))
+
+    def _record_of_name(
+        self, level: str, parent_code: str | None, name: str
+    ) -> int | None:
+        return self._by_name.get((level, _lookup_key(parent_code), name))
+
+    def _owner_of(self, ua_code: str) -> int | None:
+        """Index of the first record having the code on any level."""
+        return self._code_owner.get(self._owner_key(ua_code or ""))
+
+    def _children_of(
+        self, level: str, parent_key: str | None, parent_code: str | None
+    ) -> list[tuple[str, str]]:
+        children = self._children.get((level, parent_key, _lookup_key(parent_code)))
+        if children is None:
+            return []
+        return [
+            (self._names[self._name_ids[i]].strip(), self._field(i, "Category"))
+            for i in children
+        ]
+
+    def _children_with_codes_of(
+        self, level: str, parent_code: str | None
+    ) -> list[tuple[str, str, str | None]]:
+        # The code is that of the first child with the name, as in _get_code()
+        code_key = self.LEVEL_KEY[level]
+        return [
+            (
+                name,
+                cat,
+                self._field(self._record_of_name(level, parent_code, name), code_key)
+                or None,
+            )
+            for name, cat in self._children_of(
+                level, self.PARENT_KEY[level], parent_code
+            )
+        ]
+
     def _norm(self, s: str) -> str:
         return s.strip().lower()
 
+    async def _run(self, cost: int, func, *args):
+        """
+        Run a lookup inline on the event loop when it is cheap: a thread hand-off
+        would cost more than the lookup itself. Expensive calls go to the
+        bounded scan executor.
+        """
+        if cost <= self.INLINE_COST:
+            return func(*args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_scan_executor, partial(func, *args))
+
     def _list_level_with_cat(
         self,
         level: str,
         parent_key: str = None,
         parent_code: str = None,
     ) -> list[tuple[str, str]]:
+        if not parent_key:
+            return self._children_of(level, None, None)
+        if parent_key == self.PARENT_KEY[level]:
+            return self._children_of(level, parent_key, parent_code)
+
+        # Non-standard parent key: not indexed, fall back to a scan
         cats = self.LEVEL_CAT[level]
         items: dict[str, str] = {}
-        for r in self.recs:
-            cat = r.get("Category")
+        for i in range(len(self.recs)):
+            cat = self._field(i, "Category")
             if cat not in cats:
                 continue
-            if parent_key and r.get(parent_key) != parent_code:
+            if self._field(i, parent_key) != parent_code:
                 continue
-            name = r.get("Name", "").strip()
+            name = self._field(i, "Name").strip()
             if name:
                 items[name] = cat
         return sorted(items.items(), key=lambda nc: nc[0].lower())
@@ -89,10 +482,29 @@ class CityRegistry:
         parent_key: str = None,
         parent_code: str = None,
     ) -> list[tuple[str, str]]:
-        return await asyncio.to_thread(
-            self._list_level_with_cat, level, parent_key, parent_code
+        indexed = not parent_key or parent_key == self.PARENT_KEY[level]
+        return await self._run(
+            1 if indexed else len(self.recs),
+            self._list_level_with_cat,
+            level,
+            parent_key,
+            parent_code,
         )
 
+    def _list_children(
+        self, level: str, parent_code: str = None
+    ) -> list[tuple[str, str, str | None]]:
+        """
+        List units of a level under the parent with the given code (regions need
+        no parent) as sorted (name, category, code) tuples.
+        """
+        return self._children_with_codes_of(level, parent_code)
+
+    async def list_children(
+        self, level: str, parent_code: str = None
+    ) -> list[tuple[str, str, str | None]]:
+        return await self._run(1, self._list_children, level, parent_code)
+
     def _get_code(
         self,
         region_name: str,
@@ -101,70 +513,35 @@ class CityRegistry:
         unit_name: str = None,
     ) -> str | None:
         # 1) region
-        reg = next(
-            (
-                r
-                for r in self.recs
-                if r.get("Category") in ("O", "K")
-                and r.get("Name", "").strip() == region_name
-            ),
-            None,
-        )
-        if not reg:
+        reg = self._record_of_name("region", None, region_name)
+        if reg is None:
             return None
-        code = reg["First_Level"]
+        code = self._field(reg, "First_Level")
 
         if not district_name:
             return code
 
         # 2) district
-        dist = next(
-            (
-                r
-                for r in self.recs
-                if r.get("Category") == "P"
-                and r.get("First_Level") == code
-                and r.get("Name", "").strip() == district_name
-            ),
-            None,
-        )
-        if not dist:
+        dist = self._record_of_name("district", code, district_name)
+        if dist is None:
             return None
-        code = dist["Second_Level"]
+        code = self._field(dist, "Second_Level")
 
         if not community_name:
             return code
 
         # 3) community
-        comm = next(
-            (
-                r
-                for r in self.recs
-                if r.get("Category") == "H"
-                and r.get("Second_Level") == code
-                and r.get("Name", "").strip() == community_name
-            ),
-            None,
-        )
-        if not comm:
+        comm = self._record_of_name("community", code, community_name)
+        if comm is None:
             return None
-        code = comm["Third_Level"]
+        code = self._field(comm, "Third_Level")
 
         if not unit_name:
             return code
 
         # 4) unit (C, M або X)
-        unit = next(
-            (
-                r
-                for r in self.recs
-                if r.get("Category") in ("C", "M", "X")
-                and r.get("Third_Level") == code
-                and r.get("Name", "").strip() == unit_name
-            ),
-            None,
-        )
-        return unit and unit["Fourth_Level"] or None
+        unit = self._record_of_name("unit", code, unit_name)
+        return None if unit is None else self._field(unit, "Fourth_Level") or None
 
     async def get_code(
         self,
@@ -173,136 +550,162 @@ class CityRegistry:
         community_name: str = None,
         unit_name: str = None,
     ) -> str | None:
-        return await asyncio.to_thread(
-            self._get_code, region_name, district_name, community_name, unit_name
+        return await self._run(
+            1, self._get_code, region_name, district_name, community_name, unit_name
         )
 
-    def _get_chain(self, rec: dict) -> tuple[list[str], str, str]:
-        chain: list[str] = []
-        cat: str = rec.get("Category", "")
-
-        # Обробка значень NaN для всіх рівнів
-        def safe_value(val) -> str:
-            if val is None or (isinstance(val, float) and math.isnan(val)):
-                return ""
-            return (
-                str(int(val))
-                if isinstance(val, float) and val.is_integer()
-                else str(val)
-            )
-
-        f1 = safe_value(rec.get("First_Level"))
-        s2 = safe_value(rec.get("Second_Level"))
-        t3 = safe_value(rec.get("Third_Level"))
-        f4 = safe_value(rec.get("Fourth_Level"))
-
-        # region
-        reg = next(
-            (
-                r
-                for r in self.recs
-                if r.get("Category") in ("O", "K")
-                and safe_value(r.get("First_Level")) == f1
-            ),
-            None,
+    def _chain_at(self, idx: int) -> tuple[list[str], str, str]:
+        names, name_ids, recs, codes = (
+            self._names,
+            self._name_ids,
+            self._chain_recs,
+            self._codes,
         )
-        if reg:
-            chain.append(reg["Name"].strip())
-            if safe_value(reg.get("Category")) == "K":
-                cat = "K"
-
-        # district
-        if s2:
-            dist = next(
-                (
-                    r
-                    for r in self.recs
-                    if safe_value(r.get("Category")) == "P"
-                    and safe_value(r.get("Second_Level")) == s2
-                ),
-                None,
-            )
-            if dist:
-                chain.append(dist["Name"].strip())
-
-        # community
-        if t3:
-            comm = next(
-                (
-                    r
-                    for r in self.recs
-                    if safe_value(r.get("Category")) == "H"
-                    and safe_value(r.get("Third_Level")) == t3
-                ),
-                None,
-            )
-            if comm:
-                chain.append(comm["Name"].strip())
-
-        # unit
-        if f4:
-            unit = next(
-                (
-                    r
-                    for r in self.recs
-                    if safe_value(r.get("Category")) in ("C", "M", "X")
-                    and safe_value(r.get("Fourth_Level")) == f4
-                ),
-                None,
-            )
-            if unit:
-                chain.append(unit["Name"].strip())
-                cat = safe_value(unit.get("Category"))
-
-        # Визначення коду
-        code = f4 or t3 or s2 or f1 or ""
+        base = 4 * idx
+        chain = []
+        for pos in range(base, base + 4):
+            if recs[pos] >= 0:
+                chain.append(names[name_ids[recs[pos]]].strip())
+        # Code of the deepest level present
+        code = codes[base + 3] or codes[base + 2] or codes[base + 1] or codes[base]
+        return chain, self._decode_code(code), self._categories[self._chain_cats[idx]]
+
+    def _get_chain(self, rec: Record | dict) -> tuple[list[str], str, str]:
+        if isinstance(rec, Record) and rec.registry is self:
+            return self._chains[rec.index]
+
+        # Any other record: resolve its level codes like the chain table does
+        codes = [_safe_value(rec.get(key)) for key in self.LEVEL_KEY.values()]
+        chain: list[str] = []
+        cat = rec.get("Category", "")
+        for level, code in zip(self.LEVEL_KEY, codes):
+            idx = self._record_of_code(level, code) if code else None
+            if idx is None:
+                continue
+            chain.append(self._field(idx, "Name").strip())
+            level_cat = self._field(idx, "Category")
+            if level == "unit" or (level == "region" and level_cat == "K"):
+                cat = level_cat
+        code = codes[3] or codes[2] or codes[1] or codes[0]
         return chain, code, cat
 
-    async def get_chain(self, rec: dict) -> tuple[list[str], str, str]:
-        return await asyncio.to_thread(self._get_chain, rec)
+    async def get_chain(self, rec: Record | dict) -> tuple[list[str], str, str]:
+        return await self._run(1, self._get_chain, rec)
 
-    def _search(self, query: str) -> list[tuple[list[str], str, str]]:
+    def _search(
+        self, query: str, prefix: bool = False
+    ) -> list[tuple[list[str], str, str]]:
         q = self._norm(query)
-        results: list[tuple[list[str], str, str]] = []
-        for r in self.recs:
-            if q in self._norm(r.get("Name", "")):
-                chain, code, cat = self._get_chain(r)
-                if cat in ("C", "M", "X", "K") and code and code != "nan":
-                    results.append((chain, code, cat))
-        return results
-
-    async def search(self, query: str) -> list[tuple[list[str], str, str]]:
-        return await asyncio.to_thread(self._search, query)
+        return [self._chains[i] for i in self._name_index.search(q, prefix=prefix)]
+
+    async def search(
+        self, query: str, prefix: bool = False
+    ) -> list[tuple[list[str], str, str]]:
+        cost = self._name_index.cost(self._norm(query))
+        return await self._run(cost, self._search, query, prefix)
+
+    def iter_search(
+        self, query: str, prefix: bool = False, after: int = -1
+    ) -> Iterator[tuple[int, tuple[list[str], str, str]]]:
+        """
+        Lazily yield (position, match) in codifier order. The position of the
+        last consumed match can be passed back as `after` to resume.
+        """
+        q = self._norm(query)
+        for i in self._name_index.iter_search(q, prefix=prefix, after=after):
+            yield i, self._chains[i]
+
+    def _search_page(
+        self, query: str, limit: int = None, prefix: bool = False, after: int = -1
+    ) -> tuple[list[tuple[list[str], str, str]], int | None]:
+        """
+        Return up to `limit` matches (all if None) after position `after`, and
+        the position to continue from (None when there are no more matches).
+        """
+        stop = None if limit is None else limit + 1
+        found = list(islice(self.iter_search(query, prefix, after), stop))
+        if limit is None or len(found) <= limit:
+            return [match for _, match in found], None
+        found = found[:limit]
+        return [match for _, match in found], found[-1][0]
+
+    async def search_page(
+        self, query: str, limit: int = None, prefix: bool = False, after: int = -1
+    ) -> tuple[list[tuple[list[str], str, str]], int | None]:
+        cost = self._name_index.cost(self._norm(query))
+        return await self._run(cost, self._search_page, query, limit, prefix, after)
 
     def _search_by_code(self, ua_code: str) -> tuple[list[str], str, str] | None:
-        # Нормалізуємо вхідний код
-        input_full = (ua_code or "").strip().upper()
-        input_no_prefix = input_full[2:] if input_full.startswith("UA") else input_full
-
-        # Функція безпечного читання значень
-        def safe_value(val) -> str:
-            if val is None or (isinstance(val, float) and math.isnan(val)):
-                return ""
-            return (
-                str(int(val))
-                if isinstance(val, float) and val.is_integer()
-                else str(val)
-            )
-
-        # Пошук по всіх рівнях
-        for record in self.recs:
-            for key in ["First_Level", "Second_Level", "Third_Level", "Fourth_Level"]:
-                raw = safe_value(record.get(key))
-                val_full = (raw or "").strip().upper()
-                val_no_prefix = val_full[2:] if val_full.startswith("UA") else val_full
-                if val_full == input_full or val_no_prefix == input_no_prefix:
-                    return self._get_chain(record)
-
-        return None
+        idx = self._owner_of(ua_code)
+        if idx is None:
+            return None
+        return self._chains[idx]
 
     async def search_by_code(self, ua_code: str) -> tuple[list[str], str, str] | None:
         """Асинхронна версія пошуку за кодом"""
-        return await asyncio.to_thread(self._search_by_code, ua_code)
+        return await self._run(1, self._search_by_code, ua_code)
+
+    def _ancestor_codes(self, ua_code: str) -> list[str] | None:
+        """
+        Codes of the unit and of every unit above it, top down, in the "UA..."
+        form; None for an unknown code.
+        """
+        input_full = (ua_code or "").strip().upper()
+        input_no_prefix = input_full[2:] if input_full.startswith("UA") else input_full
+
+        idx = self._owner_of(ua_code)
+        if idx is None:
+            return None
+        rec = self.recs[idx]
+        codes: list[str] = []
+        for key in self.LEVEL_KEY.values():
+            val = _safe_value(rec.get(key)).strip().upper()
+            no_prefix = val[2:] if val.startswith("UA") else val
+            if not no_prefix:
+                continue
+            codes.append("UA" + no_prefix)
+            if no_prefix == input_no_prefix:
+                break
+        return codes
+
+    def _ancestor_codes_many(self, ua_codes: list[str]) -> list[list[str] | None]:
+        return [self._ancestor_codes(code) for code in ua_codes]
+
+    async def ancestor_codes_many(self, ua_codes: list[str]) -> list[list[str] | None]:
+        """Codes of the units containing each of the given UA codes."""
+        return await self._run(len(ua_codes), self._ancestor_codes_many, ua_codes)
+
+    def _get_codes_many(self, names: list[tuple[str, ...]]) -> list[str | None]:
+        return [self._get_code(*chain) for chain in names]
+
+    async def get_codes_many(self, names: list[tuple[str, ...]]) -> list[str | None]:
+        """
+        Resolve many (region, district, community, unit) name chains at once;
+        trailing names may be omitted.
+        """
+        return await self._run(len(names), self._get_codes_many, names)
+
+    def _search_by_codes(
+        self, ua_codes: list[str]
+    ) -> list[tuple[list[str], str, str] | None]:
+        return [self._search_by_code(code) for code in ua_codes]
+
+    async def search_by_codes(
+        self, ua_codes: list[str]
+    ) -> list[tuple[list[str], str, str] | None]:
+        """Look up many UA codes at once, in the order given."""
+        return await self._run(len(ua_codes), self._search_by_codes, ua_codes)
+
+    def _get_chains_many(
+        self, recs: list[Record | dict]
+    ) -> list[tuple[list[str], str, str]]:
+        return [self._get_chain(rec) for rec in recs]
+
+    async def get_chains_many(
+        self, recs: list[Record | dict]
+    ) -> list[tuple[list[str], str, str]]:
+        """Build chains for many records at once."""
+        return await self._run(len(recs), self._get_chains_many, recs)
 
     def get_provider(self) -> dict | None:
         """Return provider metadata from the codifier file if present."""
@@ -312,6 +715,10 @@ class CityRegistry:
         """Return order metadata from the codifier file if present."""
         return self.order
 
+    def get_credit(self) -> dict:
+        """Return provider and order metadata as one credit block."""
+        return self.credit
+
 
 def choose_typed(
     options: list[tuple[str, str]],
@@ -0,0 +1,191 @@
+import datetime
+import json
+import os
+import re
+import shutil
+
+from core.config import codifier_versions_keep
+from core.tools.location.snapshot import file_sha1, read_header, snapshot_path
+from core.tools.location.store import open_mapped_registry, store_path
+
+META_FILE = "version.json"
+PIN_FILE = "PINNED"
+
+
+def _link_or_copy(src: str, dst: str) -> None:
+    # Either way the file keeps its size and mtime, so its snapshot stays current
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _write_json(path: str, data) -> None:
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, default=str)
+    os.replace(tmp_path, path)
+
+
+class VersionStore:
+    """
+    The last few codifier versions, one directory per order number under
+    versions/ next to the codifier JSON. Each keeps the JSON with its snapshot
+    and its store, so any of them can be made active again without parsing
+    anything or building indexes. A pinned version stays active whatever
+    newer orders get downloaded, until it is unpinned.
+    """
+
+    def __init__(self, json_path, keep: int = codifier_versions_keep):
+        self.json_path = str(json_path)
+        self.root = os.path.join(os.path.dirname(self.json_path), "versions")
+        self.keep = keep
+
+    def _dir(self, order_number: str) -> str:
+        return os.path.join(self.root, re.sub(r"[^\w.-]", "_", order_number))
+
+    def path_of(self, order_number: str) -> str:
+        """Codifier JSON of a stored version."""
+        return os.path.join(self._dir(order_number), os.path.basename(self.json_path))
+
+    def get(self, order_number: str) -> dict | None:
+        """{"order", "version", "archived_at"} of a stored version, or None."""
+        try:
+            with open(
+                os.path.join(self._dir(order_number), META_FILE), encoding="utf-8"
+            ) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def versions(self) -> list[dict]:
+        """Stored versions, the last archived first."""
+        try:
+            names = os.listdir(self.root)
+        except FileNotFoundError:
+            return []
+        items = []
+        for name in names:
+            if name.endswith((".tmp", ".old")):
+                continue  # being archived by another process
+            meta = self.get(name)
+            if meta is not None:
+                items.append(meta)
+        items.sort(key=lambda meta: meta["archived_at"], reverse=True)
+        return items
+
+    def archive(self, order: dict | None, version: str) -> dict | None:
+        """
+        Store the current codifier JSON, of the given order and version, with
+        its snapshot and store. A stored copy of the same order is replaced
+        when its version differs. The oldest versions beyond `keep` are dropped.
+        """
+        number = (order or {}).get("number")
+        if not number:
+            return None
+        stored = self.get(number)
+        if stored is not None and stored["version"] == version:
+            # Archived before versions had stores, or the store was lost
+            open_mapped_registry(self.path_of(number))
+            return stored
+
+        # Assembled aside and renamed into place, so readers never see half of it
+        directory = self._dir(number)
+        tmp_dir = f"{directory}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        target = os.path.join(tmp_dir, os.path.basename(self.json_path))
+        _link_or_copy(self.json_path, target)
+        if read_header(self.json_path) is not None:
+            _link_or_copy(snapshot_path(self.json_path), snapshot_path(target))
+        if os.path.exists(store_path(self.json_path)):
+            _link_or_copy(store_path(self.json_path), store_path(target))
+        meta = {
+            "order": order,
+            "version": version,
+            "archived_at": datetime.datetime.now().isoformat(),
+        }
+        _write_json(os.path.join(tmp_dir, META_FILE), meta)
+
+        old_dir = f"{directory}.{os.getpid()}.old"
+        if os.path.exists(directory):
+            os.rename(directory, old_dir)
+        os.rename(tmp_dir, directory)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+        # Rebuilt here, in the refresh worker, when the linked one is stale,
+        # rather than by every server process on activation
+        open_mapped_registry(self.path_of(number))
+
+        self._prune()
+        return meta
+
+    def _prune(self) -> None:
+        pinned = self.pinned()
+        for meta in self.versions()[self.keep :]:
+            number = meta["order"]["number"]
+            if number != pinned:
+                shutil.rmtree(self._dir(number), ignore_errors=True)
+
+    def pinned(self) -> str | None:
+        """Order number of the pinned version, if any."""
+        try:
+            with open(os.path.join(self.root, PIN_FILE), encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def source_state(self) -> tuple:
+        """
+        Cheap fingerprint of the codifier to serve, changing whenever a pin is
+        set or removed or the active file is replaced.
+        """
+        state = []
+        for path in (os.path.join(self.root, PIN_FILE), self.active_path()):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                state.append(None)
+            else:
+                state.append((stat.st_ino, stat.st_mtime_ns, stat.st_size))
+        return tuple(state)
+
+    def pin(self, order_number: str) -> dict:
+        """Make a stored version the active one. KeyError when it is not stored."""
+        meta = self.get(order_number)
+        if meta is None or not os.path.exists(self.path_of(order_number)):
+            raise KeyError(order_number)
+        path = os.path.join(self.root, PIN_FILE)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(order_number)
+        os.replace(tmp_path, path)
+        return meta
+
+    def unpin(self) -> None:
+        """Make the latest downloaded codifier the active one again."""
+        try:
+            os.remove(os.path.join(self.root, PIN_FILE))
+        except FileNotFoundError:
+            pass
+
+    def active_path(self) -> str:
+        """Codifier JSON to serve: the pinned version, else the latest download."""
+        pinned = self.pinned()
+        if pinned is not None:
+            path = self.path_of(pinned)
+            if os.path.exists(path):
+                return path
+            print(f"PINNED CODIFIER VERSION {pinned} NOT FOUND")
+        return self.json_path
+
+    def active_version(self) -> str | None:
+        """Version of the codifier to serve, None when there is none."""
+        path = self.active_path()
+        header = read_header(path)
+        if header is not None:
+            return header["source"]["sha1"]
+        try:
+            return file_sha1(path)
+        except FileNotFoundError:
+            return None
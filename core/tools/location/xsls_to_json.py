@@ -2,10 +2,27 @@ import cloudscraper
 import requests
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin
-import pandas as pd
+from openpyxl import load_workbook
+from typing import Iterable, Iterator
+import hashlib
 import json
-from io import BytesIO
+import math
+import os
 import re
+import tempfile
+from contextlib import suppress
+
+from core.tools.location.snapshot import (
+    FIELDS,
+    SnapshotBuilder,
+    file_sha1,
+    load_snapshot,
+    read_header,
+    write_snapshot,
+)
+from core.tools.location.store import write_store
+from core.tools.location.tool import CityRegistry, _safe_value
+from core.tools.location.versions import VersionStore
 
 BASE_URL = "https://mindev.gov.ua/"
 PAGE_URL = "https://mindev.gov.ua/diialnist/rozvytok-mistsevoho-samovriaduvannia/kodyfikator-administratyvno-terytorialnykh-odynyts-ta-terytorii-terytorialnykh-hromad"
@@ -16,10 +33,22 @@ HEADERS = {
     "Referer": BASE_URL,
 }
 
+SHEET_NAME = "Кодифікатор"
+COLUMNS = ("level1", "level2", "level3", "level4", "level_extra", "category", "name")
+# Data follows the header row and three rows of column notes
+FIRST_DATA_ROW = 5
+
+PROVIDER = {
+    "name": "Міністерство розвитку громад, територій та інфраструктури України",
+    "service": "Кодифікатор адміністративно-територіальних одиниць",
+    "license": "Creative Commons Attribution 4.0 International (CC BY 4.0)",
+}
+
 scraper = cloudscraper.create_scraper()
 
 
 def get_latest_entry():
+    resp = None
     try:
         resp = scraper.get(PAGE_URL, headers=HEADERS)
         resp.raise_for_status()
@@ -60,52 +89,449 @@ def get_latest_entry():
     return entries[0]
 
 
-def parse_xlsx_to_json(entry, save_as="core/tools/location/kodifikator.json"):
-    resp = scraper.get(entry["xlsx_url"], headers=HEADERS)
+def _cell_value(value):
+    """Empty cells and NaN become null, integer-like floats become ints."""
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def iter_codifier_rows(xlsx_file) -> Iterator[dict]:
+    """
+    Read the codifier records of an XLSX file one row at a time, without
+    loading the sheet into memory.
+    """
+    wb = load_workbook(xlsx_file, read_only=True, data_only=True)
+    try:
+        rows = wb[SHEET_NAME].iter_rows(
+            min_row=FIRST_DATA_ROW, max_col=len(COLUMNS), values_only=True
+        )
+        for row in rows:
+            values = [_cell_value(value) for value in row]
+            if all(value is None for value in values):
+                continue
+            values += [None] * (len(COLUMNS) - len(values))
+            yield dict(zip(COLUMNS, values))
+    finally:
+        wb.close()
+
+
+def write_codifier_json(
+    save_as,
+    provider: dict,
+    order: dict,
+    rows: Iterable[dict],
+    download: dict | None = None,
+):
+    """
+    Write the codifier JSON and its snapshot as the records come, one record
+    per line. The file is replaced only once it is complete.
+    """
+    builder = SnapshotBuilder()
+    # Unique per process: several workers may refresh at the same time
+    tmp_path = f"{save_as}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write('{\n  "provider": ')
+            f.write(json.dumps(provider, ensure_ascii=False))
+            f.write(',\n  "order": ')
+            f.write(json.dumps(order, ensure_ascii=False))
+            f.write(',\n  "download": ')
+            f.write(json.dumps(download, ensure_ascii=False))
+            f.write(',\n  "data": [')
+            separator = "\n    "
+            for rec in rows:
+                f.write(separator)
+                f.write(json.dumps(rec, ensure_ascii=False, default=str))
+                separator = ",\n    "
+                builder.add(rec)
+            f.write("\n  ]\n}\n")
+    except BaseException:
+        # A broken XLSX leaves the stored codifier as it was
+        with suppress(FileNotFoundError):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, save_as)
+    with suppress(FileNotFoundError):
+        # Its download block is in the new file
+        os.remove(download_path(save_as))
+
+    try:
+        # Loaded by CityRegistry instead of the JSON while it is up to date
+        builder.write(save_as, provider, order, download)
+    except OSError as e:
+        print(f"CODIFIER SNAPSHOT NOT WRITTEN: {e}")
+    try:
+        # Built here rather than by the server processes when they load it
+        write_store(CityRegistry(str(save_as)), save_as)
+    except OSError as e:
+        print(f"CODIFIER STORE NOT WRITTEN: {e}")
+
+
+def download_path(json_path) -> str:
+    return os.path.splitext(str(json_path))[0] + ".download.json"
+
+
+def save_download(json_path, download: dict) -> None:
+    """
+    Keep new validators of the XLSX a stored codifier was made from, when the
+    server changed them for the same contents, see read_codifier_source().
+    """
+    path = download_path(json_path)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(download, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _latest_download(json_path, download: dict | None) -> dict | None:
+    # Saved validators only apply to the XLSX the codifier was made from
+    try:
+        with open(download_path(json_path), "rb") as f:
+            saved = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return download
+    if download and saved.get("sha1") == download.get("sha1"):
+        return saved
+    return download
+
+
+def read_codifier_source(path) -> dict:
+    """
+    The "order" and "download" blocks and the version of a stored codifier,
+    read from its snapshot header when there is one; {} without a codifier.
+    """
+    header = read_header(path)
+    if header is not None:
+        return {
+            "order": header.get("order"),
+            "download": _latest_download(path, header.get("download")),
+            "version": header["source"]["sha1"],
+        }
+    try:
+        with open(path, "rb") as f:
+            content = f.read()
+        raw = json.loads(content)
+    except (FileNotFoundError, ValueError):
+        return {}
+    if not isinstance(raw, dict):
+        return {"version": hashlib.sha1(content).hexdigest()}
+    return {
+        "order": raw.get("order"),
+        "download": _latest_download(path, raw.get("download")),
+        "version": hashlib.sha1(content).hexdigest(),
+    }
+
+
+def _download(url: str, file, known: dict | None = None) -> dict | None:
+    """
+    Download the XLSX into a file. With the download block of a stored copy,
+    the request is conditional: None means the server has nothing newer.
+    Return the new download block, with the validators and the content hash.
+    """
+    headers = dict(HEADERS)
+    if known and known.get("etag"):
+        headers["If-None-Match"] = known["etag"]
+    if known and known.get("last_modified"):
+        headers["If-Modified-Since"] = known["last_modified"]
+    resp = scraper.get(url, headers=headers, stream=True)
+    if resp.status_code == 304:
+        return None
     try:
         resp.raise_for_status()
     except Exception as e:
         print(f"HTTPError: {e}\nResponse content: {getattr(resp, 'text', '')}")
         raise
+    sha1 = hashlib.sha1()
+    size = 0
+    for chunk in resp.iter_content(chunk_size=1 << 16):
+        file.write(chunk)
+        sha1.update(chunk)
+        size += len(chunk)
+    return {
+        "xlsx_url": url,
+        "etag": resp.headers.get("ETag"),
+        "last_modified": resp.headers.get("Last-Modified"),
+        "size": size,
+        "sha1": sha1.hexdigest(),
+    }
 
-    excel_data = pd.ExcelFile(BytesIO(resp.content))
-    df = pd.read_excel(excel_data, sheet_name="Кодифікатор")
-    df = df.drop(index=[0, 1, 2])
-    df.columns = [
-        "level1",
-        "level2",
-        "level3",
-        "level4",
-        "level_extra",
-        "category",
-        "name",
-    ]
-    df = df.reset_index(drop=True)
 
-    result = {
-        "provider": {
-            "name": "Міністерство розвитку громад, територій та інфраструктури України",
-            "service": "Кодифікатор адміністративно-територіальних одиниць",
-            "license": "Creative Commons Attribution 4.0 International (CC BY 4.0)",
-        },
-        "order": {
-            "title": entry["order_title"],
-            "number": entry["order_number"],
-            "date": entry["order_date"],
-            "pdf_url": entry["pdf_url"],
-        },
-        "data": df.to_dict(orient="records"),
+def _unchanged(url: str, known: dict) -> bool:
+    """
+    Whether the XLSX of a stored copy is still the one at its URL, asked with
+    a HEAD request so the workbook is not downloaded to find out: the server
+    may well ignore conditional requests. Without a validator or size to
+    compare, the same order and URL are taken as unchanged. A failed check
+    is not: the caller then makes the conditional GET, whose errors surface.
+    """
+    headers = dict(HEADERS)
+    if known.get("etag"):
+        headers["If-None-Match"] = known["etag"]
+    if known.get("last_modified"):
+        headers["If-Modified-Since"] = known["last_modified"]
+    try:
+        resp = scraper.head(url, headers=headers, allow_redirects=True)
+    except Exception as e:
+        print(f"XLSX CHECK FAILED: {e!r}")
+        return False
+    if resp.status_code == 304:
+        return True
+    if resp.status_code >= 400:
+        print(f"XLSX CHECK FAILED: HTTP {resp.status_code}")
+        return False
+    etag = resp.headers.get("ETag")
+    if etag and known.get("etag"):
+        return etag == known["etag"]
+    last_modified = resp.headers.get("Last-Modified")
+    if last_modified and known.get("last_modified"):
+        return last_modified == known["last_modified"]
+    length = resp.headers.get("Content-Length")
+    if length and length.isdigit() and known.get("size") is not None:
+        return int(length) == known["size"]
+    return True
+
+
+def _unit(values: list[str]) -> tuple[str, tuple[str, str, str]]:
+    """
+    Code of the unit a record (values in FIELDS order) describes, and its
+    (name, category, parent code): the deepest code of the record is its own,
+    the one above it is the parent's.
+    """
+    level1, level2, level3, level4, level_extra, category, name = values
+    codes = [code for code in (level1, level2, level3, level4, level_extra) if code]
+    if not codes:
+        return "", (name, category, "")
+    return codes[-1], (name, category, codes[-2] if len(codes) > 1 else "")
+
+
+def load_codifier_units(path) -> dict[str, tuple[str, str, str]] | None:
+    """
+    {code: (name, category, parent code)} of a stored codifier, read from its
+    snapshot when it is current; None when there is no codifier to read.
+    """
+    snapshot = load_snapshot(path)
+    if snapshot is not None:
+        strings = snapshot["strings"]
+        rows = ([strings[i] for i in row] for row in zip(*snapshot["columns"]))
+    else:
+        try:
+            with open(path, "rb") as f:
+                raw = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if not isinstance(raw, dict) or not isinstance(raw.get("data"), list):
+            return None
+        rows = (
+            [_safe_value(rec.get(field)) for field in FIELDS] for rec in raw["data"]
+        )
+    units: dict[str, tuple[str, str, str]] = {}
+    for values in rows:
+        code, unit = _unit(values)
+        if code:
+            units.setdefault(code, unit)
+    return units
+
+
+class CodifierDiff:
+    """
+    Changes from the stored codifier to a new one streamed record by record.
+
+    The stored units are a hash table keyed by code that every new record is
+    looked up in once, so the diff is linear in the number of records.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.old_units: dict[str, tuple[str, str, str]] | None = None
+        self._seen: set[str] = set()
+        self._added: list[str] = []
+        # kind -> [{"code", "old", "new"}], in the order of the unit fields
+        self._changed: dict[str, list[dict]] = {
+            "renamed": [],
+            "recategorized": [],
+            "reparented": [],
+        }
+
+    def feed(self, rows: Iterable[dict]) -> Iterator[dict]:
+        """Pass the new records through, diffing each of them."""
+        # Read before the new codifier replaces the stored one
+        self.old_units = load_codifier_units(self.path)
+        for rec in rows:
+            self.add(rec)
+            yield rec
+
+    def add(self, rec: dict) -> None:
+        if self.old_units is None:
+            return
+        code, unit = _unit([_safe_value(rec.get(field)) for field in FIELDS])
+        if not code or code in self._seen:
+            return
+        self._seen.add(code)
+        old_unit = self.old_units.get(code)
+        if old_unit is None:
+            self._added.append(code)
+            return
+        for kind, old, new in zip(self._changed, old_unit, unit):
+            if old != new:
+                self._changed[kind].append({"code": code, "old": old, "new": new})
+
+    def changes(self) -> dict[str, list] | None:
+        """Codes by kind of change; None when there was nothing to diff against."""
+        if self.old_units is None:
+            return None
+        removed = [code for code in self.old_units if code not in self._seen]
+        return {"added": self._added, "removed": removed, **self._changed}
+
+
+def diff_path(json_path) -> str:
+    return os.path.splitext(str(json_path))[0] + ".diff.json"
+
+
+def write_diff_report(json_path, report: dict) -> str:
+    path = diff_path(json_path)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_diff_report(json_path) -> dict | None:
+    """Changes made by the last update of the codifier, if it replaced one."""
+    try:
+        with open(diff_path(json_path), "rb") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _order_block(entry: dict) -> dict:
+    return {
+        "title": entry["order_title"],
+        "number": entry["order_number"],
+        "date": entry["order_date"],
+        "pdf_url": entry["pdf_url"],
     }
 
-    with open(save_as, "w", encoding="utf-8") as f:
-        json.dump(result, f, ensure_ascii=False, indent=2)
 
+def parse_xlsx_to_json(
+    entry,
+    save_as="core/tools/location/kodifikator.json",
+    known: dict | None = None,
+    diff: CodifierDiff | None = None,
+):
+    """
+    Download the XLSX of an order and write it as the codifier JSON. `known`
+    is the download block of the stored copy of the same order: the XLSX is
+    then checked with a HEAD request first, requested conditionally and not
+    parsed again when it is unchanged, in which case None is returned. The
+    new records are passed through `diff`.
+    """
+    if known and _unchanged(entry["xlsx_url"], known):
+        return None
+    # The workbook is a zip archive and has to be seekable
+    with tempfile.TemporaryFile() as xlsx:
+        download = _download(entry["xlsx_url"], xlsx, known)
+        if download is None:
+            return None
+        if known and download["sha1"] == known.get("sha1"):
+            if download != known:
+                try:
+                    # Otherwise every later check would see new validators
+                    save_download(save_as, download)
+                except OSError as e:
+                    print(f"CODIFIER DOWNLOAD BLOCK NOT WRITTEN: {e}")
+            return None
+        xlsx.seek(0)
+        rows = iter_codifier_rows(xlsx)
+        if diff is not None:
+            rows = diff.feed(rows)
+        write_codifier_json(save_as, PROVIDER, _order_block(entry), rows, download)
     return save_as
 
 
-async def download_xlsx_and_parse_to_json():
+def _same_order(order: dict | None, entry: dict) -> bool:
+    return bool(order) and (order.get("number"), order.get("date")) == (
+        entry["order_number"],
+        entry["order_date"],
+    )
+
+
+def _archive(save_as, order: dict | None, version: str) -> None:
+    try:
+        # Kept for pinning and rollback, see VersionStore
+        VersionStore(save_as).archive(order, version)
+    except OSError as e:
+        print(f"CODIFIER VERSION NOT ARCHIVED: {e}")
+
+
+def update_codifier(save_as="core/tools/location/kodifikator.json") -> dict:
+    """
+    Download the latest codifier and write it to the given JSON file, unless
+    the stored one is of the same order and its XLSX has not changed. The
+    changes against the stored one are saved next to it, see read_diff_report().
+    """
     latest_entry = get_latest_entry()
     print(f"Знайдено наказ: {latest_entry['order_title']}")
-    saved_json = parse_xlsx_to_json(latest_entry)
+
+    stored = read_codifier_source(save_as)
+    if stored.get("version") is not None:
+        if read_header(save_as) is None:
+            try:
+                # Missing, stale or of an older format: rebuild it once
+                write_snapshot(save_as)
+            except OSError as e:
+                print(f"CODIFIER SNAPSHOT NOT WRITTEN: {e}")
+        # The stored version stays available for rollback once replaced
+        _archive(save_as, stored.get("order"), stored["version"])
+    known = None
+    if _same_order(stored.get("order"), latest_entry):
+        download = stored.get("download") or {}
+        if download.get("xlsx_url") == latest_entry["xlsx_url"]:
+            known = download
+
+    diff = CodifierDiff(save_as)
+    saved_json = parse_xlsx_to_json(latest_entry, save_as, known, diff)
+    if saved_json is None:
+        print("Кодифікатор не змінився")
+        return {
+            "status": 200,
+            "detail": "Kodifier is up to date",
+            "updated": False,
+            "version": stored["version"],
+        }
     print(f"✅ JSON збережено у {saved_json}")
-    return {"status": 200, "detail": "Kodifier has been updated"}
+    result = {
+        "status": 200,
+        "detail": "Kodifier has been updated",
+        "updated": True,
+        "version": file_sha1(saved_json),
+    }
+
+    changes = diff.changes()
+    if changes is not None:
+        counts = {kind: len(codes) for kind, codes in changes.items()}
+        # The changes are against the previous download; a version pinned
+        # meanwhile is named, as it is the one served instead of either
+        versions = VersionStore(save_as)
+        pinned = versions.pinned()
+        served = versions.get(pinned) if pinned else None
+        report = {
+            "from": {"order": stored.get("order"), "version": stored.get("version")},
+            "to": {"order": _order_block(latest_entry), "version": result["version"]},
+            "pinned": None,
+            "counts": counts,
+            "changes": changes,
+        }
+        if served is not None:
+            report["pinned"] = {"order": served["order"], "version": served["version"]}
+        try:
+            write_diff_report(saved_json, report)
+        except OSError as e:
+            print(f"CODIFIER DIFF NOT WRITTEN: {e}")
+        result["changes"] = counts
+    _archive(saved_json, _order_block(latest_entry), result["version"])
+    return result
@@ -1,4 +1,6 @@
-from contextlib import asynccontextmanager
+import asyncio
+import os
+from contextlib import asynccontextmanager, suppress
 import uvicorn
 
 from fastapi import FastAPI
@@ -9,10 +11,37 @@ from core.openapi import custom_openapi
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    from core.tools.location.xsls_to_json import download_xlsx_and_parse_to_json
-
-    await download_xlsx_and_parse_to_json()
+    from core.tools.location.registry import registry_holder
+    from core.tools.location.refresh import (
+        shutdown_refresh,
+        start_refresh,
+        wait_for_refresh,
+    )
+    from api_v1.air_alert.client import open_alerts_client, close_alerts_client
+    from api_v1.air_alert.crud import poll_active_alerts
+
+    if os.path.exists(registry_holder.path):
+        # Serve the local codifier right away and swap in a fresh one when ready
+        await registry_holder.reload()
+        start_refresh()
+    else:
+        # Nothing to serve before the first download; other server processes
+        # and refreshes requested meanwhile join this job instead of downloading
+        job = await wait_for_refresh(start_refresh())
+        if job.status != "done":
+            raise RuntimeError(f"Codifier download failed: {job.error}")
+        if registry_holder.loaded_version() is None:
+            # Downloaded by another server process
+            await registry_holder.reload()
+
+    await open_alerts_client()
+    alerts_poller = asyncio.create_task(poll_active_alerts())
     yield
+    alerts_poller.cancel()
+    with suppress(asyncio.CancelledError):
+        await alerts_poller
+    await shutdown_refresh()
+    await close_alerts_client()
 
 
 app = FastAPI(lifespan=lifespan)